@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 提取流程的可复现基准测试工具。
+使用 FFmpeg 的 lavfi 虚拟源生成合成 MP4 语料，再以独立进程运行 extract.py，统计吞吐指标并输出机器可读的 JSON：
+1、语料场景：大量短片段（tiny）、少量超长文件（long）、深层目录树（deep）、无音频文件（noaudio）、MP3 音轨文件（mp3audio，走流复制通道）。
+2、统计指标：文件数/秒、音频秒数/墙钟秒（audio_rtf）、峰值内存（peak_rss_kb，extract.py 及其 ffmpeg 子进程中单个进程的最大常驻内存，
+   并非整个进程树同时占用的总和）、启动开销（空目录运行耗时）。
+3、回归检测：通过 --baseline 指定上一次的结果文件，吞吐下降超过 --max-regression 时以非零状态码退出，便于接入 CI；
+   extract.py 任意一次以非零状态码退出时，该场景记为失败，同样以非零状态码退出（崩溃的运行不会被当作“更快”）。
+语料按场景参数缓存在 data/bench_corpus 下，重复运行不会重新生成；每个片段的画面颜色与音调各不相同，避免内容去重与缓存影响结果。
+语料与结果目录（data/benchmarks）均已加入 .gitignore。
+"""
+
+# 基础用法
+# python scripts/benchmark.py --preset quick
+# python scripts/benchmark.py --preset full --jobs 8 --output bench.json --baseline last.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from config import DATA_DIR, SKILL_ROOT
+
+EXTRACT_SCRIPT = Path(__file__).resolve().parent / "extract.py"
+CORPUS_ROOT = DATA_DIR / "bench_corpus"
+RESULT_DIR = DATA_DIR / "benchmarks"
+CORPUS_VERSION = 2                # 语料生成方式变化时递增，使旧缓存失效
+
+# 场景参数：count=文件数, duration=单文件时长(秒), depth=目录深度, audio=音频编码(None 为无音频)
+PRESETS = {
+    "quick": {
+        "tiny": {"count": 50, "duration": 2, "depth": 1, "audio": "aac"},
+        "long": {"count": 2, "duration": 600, "depth": 1, "audio": "aac"},
+        "deep": {"count": 30, "duration": 2, "depth": 10, "audio": "aac"},
+        "noaudio": {"count": 10, "duration": 2, "depth": 1, "audio": None},
+        "mp3audio": {"count": 20, "duration": 5, "depth": 1, "audio": "libmp3lame"},
+    },
+    "full": {
+        "tiny": {"count": 2000, "duration": 3, "depth": 2, "audio": "aac"},
+        "long": {"count": 2, "duration": 7200, "depth": 1, "audio": "aac"},
+        "deep": {"count": 500, "duration": 2, "depth": 25, "audio": "aac"},
+        "noaudio": {"count": 100, "duration": 2, "depth": 1, "audio": None},
+        "mp3audio": {"count": 200, "duration": 10, "depth": 2, "audio": "libmp3lame"},
+    },
+}
+
+def _spec_key(spec):
+    data = dict(spec, corpus_version=CORPUS_VERSION)
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+
+def _clip_path(root, index, depth):
+    """按深度把文件分散到多级子目录中（depth=1 时全部放在根目录）"""
+    parts = [f"d{(index + level) % 3}_{level}" for level in range(depth - 1)]
+    return root.joinpath(*parts, f"clip_{index:05d}.mp4")
+
+def _generate_clip(path, index, duration, audio):
+    """
+    用 lavfi 生成一个低分辨率、低帧率的合成 MP4（视频部分尽量便宜）
+    画面颜色与音调随 index 变化，保证每个片段的内容各不相同（否则 --dedup 只会转换一份）
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    color = (index * 2654435761) & 0xFFFFFF
+    frequency = 200 + (index * 37) % 2000
+    cmd = ["ffmpeg", "-y", "-loglevel", "error",
+           "-f", "lavfi", "-i", f"color=c=0x{color:06x}:s=64x64:r=1:d={duration}"]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency={frequency}:sample_rate=44100:duration={duration}",
+                "-c:a", audio, "-b:a", "128k"]
+    cmd += ["-c:v", "mpeg4", "-shortest", str(path)]
+    subprocess.run(cmd, check=True)
+
+def build_corpus(name, spec, jobs):
+    """生成（或复用缓存的）场景语料，返回语料目录"""
+    root = CORPUS_ROOT / f"{name}-{_spec_key(spec)}"
+    marker = root / ".complete"
+    if marker.exists():
+        return root
+    if root.exists():
+        shutil.rmtree(root)
+    print(f"🔧 正在生成语料 {name}: {spec['count']} 个文件 × {spec['duration']} 秒 ...")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(
+            lambda i: _generate_clip(_clip_path(root, i, spec["depth"]), i, spec["duration"], spec["audio"]),
+            range(spec["count"]),
+        ))
+    marker.write_text(json.dumps(spec), encoding="utf-8")
+    return root
+
+def _run_extractor(src, dest, extra_args):
+    """
+    以独立进程运行 extract.py，返回 (墙钟耗时, 峰值内存 KB, 返回码)
+    峰值内存来自 os.wait4：该进程及其等待过的 ffmpeg 子进程中，单个进程的最大常驻内存（不是同一时刻的总和）
+    """
+    env = os.environ.copy()
+    env["RUNNING_IN_VENV"] = "true"   # 基准只测提取流程本身，不触发虚拟环境切换
+    # 关闭单文件指标，避免合成语料的记录写入真实的 logs/conversion_metrics.jsonl（extra_args 中显式指定时以其为准）
+    cmd = [sys.executable, str(EXTRACT_SCRIPT), str(src), str(dest), "--metrics-file", ""] + extra_args
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+        peak = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+        return wall, peak, proc.returncode
+    proc.wait()
+    return time.perf_counter() - start, None, proc.returncode
+
+def measure_startup(repeat):
+    """
+    启动开销：对空目录运行（只包含解释器启动、导入与扫描）
+    :return: (耗时中位数, 各次返回码)
+    """
+    walls, returncodes = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "empty"
+        src.mkdir()
+        for _ in range(repeat):
+            wall, _, returncode = _run_extractor(src, Path(tmp) / "out", [])
+            walls.append(wall)
+            returncodes.append(returncode)
+    return statistics.median(walls), returncodes
+
+def run_scenario(name, spec, jobs, repeat, extra_args):
+    src = build_corpus(name, spec, jobs)
+    walls, peaks, returncodes = [], [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            wall, peak, returncode = _run_extractor(src, Path(tmp) / "out", ["--jobs", str(jobs)] + extra_args)
+        walls.append(wall)
+        returncodes.append(returncode)
+        if peak is not None:
+            peaks.append(peak)
+
+    wall = statistics.median(walls)
+    audio_seconds = spec["count"] * spec["duration"] if spec["audio"] else 0
+    return {
+        "spec": spec,
+        "files": spec["count"],
+        "audio_seconds": audio_seconds,
+        "wall_seconds": round(wall, 4),
+        "wall_seconds_all": [round(w, 4) for w in walls],
+        "files_per_sec": round(spec["count"] / wall, 3) if wall > 0 else None,
+        "audio_rtf": round(audio_seconds / wall, 3) if wall > 0 else None,
+        "peak_rss_kb": max(peaks) if peaks else None,
+        "returncodes": returncodes,
+        "ok": all(code == 0 for code in returncodes),
+    }
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=SKILL_ROOT,
+                             capture_output=True, text=True, check=False)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, max_regression):
+    """与基线对比 files_per_sec，返回回归的场景列表（运行失败的场景不参与对比，由 main 单独判定失败）"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        if not current.get("ok", True):
+            continue
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous.get("files_per_sec") or not current.get("files_per_sec"):
+            continue
+        change = current["files_per_sec"] / previous["files_per_sec"] - 1
+        current["change_vs_baseline"] = round(change, 4)
+        if change < -max_regression:
+            regressions.append((name, change))
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MP4→MP3 提取流程基准测试")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="语料规模（默认 quick）")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="只运行指定场景（默认全部）")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="传给 extract.py 的并发数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景重复次数（取中位数）")
+    parser.add_argument("--extract-args", default="", help="额外传给 extract.py 的参数（如 \"--no-stream-copy\"）")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径（默认 data/benchmarks/bench-<时间>.json）")
+    parser.add_argument("--baseline", default=None, help="基线结果 JSON，用于检测吞吐回归")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="允许的吞吐下降比例（默认 0.10）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if shutil.which("ffmpeg") is None:
+        print("❌ 未找到 ffmpeg，请先安装并加入 PATH")
+        return 1
+
+    preset = PRESETS[args.preset]
+    names = args.scenarios or list(preset)
+    unknown = [n for n in names if n not in preset]
+    if unknown:
+        print(f"❌ 未知场景: {', '.join(unknown)}（可选: {', '.join(preset)}）")
+        return 1
+
+    extra_args = args.extract_args.split()
+    startup_seconds, startup_returncodes = measure_startup(args.repeat)
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "preset": args.preset,
+        "jobs": args.jobs,
+        "extract_args": extra_args,
+        "startup_seconds": round(startup_seconds, 4),
+        "startup_returncodes": startup_returncodes,
+        "scenarios": {},
+    }
+    exit_code = 0
+    if any(startup_returncodes):
+        print(f"❌ 空目录启动运行失败（返回码 {startup_returncodes}）")
+        exit_code = 1
+    for name in names:
+        print(f"▶ 运行场景 {name} ...")
+        results["scenarios"][name] = run_scenario(name, preset[name], args.jobs, args.repeat, extra_args)
+        r = results["scenarios"][name]
+        if not r["ok"]:
+            print(f"❌ 场景 {name} 运行失败（返回码 {r['returncodes']}），吞吐数据无效")
+            exit_code = 1
+            continue
+        print(f"   {r['files_per_sec']} files/s | audio_rtf {r['audio_rtf']} | peak {r['peak_rss_kb']} KB")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.max_regression)
+        for name, change in regressions:
+            print(f"❌ 吞吐回归: {name} {change:+.1%}")
+        if regressions:
+            exit_code = 1
+
+    output = Path(args.output) if args.output else RESULT_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ 结果已写入: {output}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 基于内容的源文件去重模块。
+归档中常有同一个 MP4 被复制到多个目录，原先每一份都会重新转换一次。开启 --dedup 后：
+1、分级指纹：先按文件大小分组；大小相同时比较头尾各 1MB 的部分哈希；部分哈希也相同时才计算全文件哈希确认。
+   绝大多数文件大小唯一，不产生任何额外读取；哈希结果按路径缓存，每个文件至多读取一次。
+2、每份不同的内容只转换一次，其余位置的输出通过硬链接 / reflink（写时复制）生成，均不可用时回退为普通复制。
+3、链接同样先写临时文件再原子重命名，不会留下半成品。
+4、哈希读取不占用调度线程：match 之前先用 ready 判断是否需要读取文件，需要时由工作线程调用 prepare 计算并缓存哈希，
+   主线程随后的 match 只比较缓存，调度不会被大文件的哈希阻塞。
+转换耗时与输出占用的磁盘空间由此只与“不同内容”的数量有关，而与文件数量无关。
+"""
+
+import os
+import shutil
+import hashlib
+
+PARTIAL_CHUNK = 1024 * 1024
+FICLONE = 0x40049409               # Linux ioctl：reflink（Btrfs / XFS 等支持写时复制的文件系统）
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+def partial_digest(path, size, chunk_size=PARTIAL_CHUNK):
+    """文件大小 + 头尾各 chunk_size 字节的 sha256"""
+    h = hashlib.sha256(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        h.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            h.update(f.read(chunk_size))
+    return h.hexdigest()
+
+def full_digest(path, chunk_size=PARTIAL_CHUNK):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ContentIndex:
+    """
+    已登记内容的索引（prepare 可在工作线程中调用，其余方法只在主线程中调用）
+    用法:
+        index = ContentIndex()
+        if not index.ready(path, size):
+            index.prepare(path, size)                 # 在工作线程中读取文件、缓存哈希
+        primary = index.match(rel_path, path, size)   # None 表示新内容，已登记为代表文件
+    """
+
+    def __init__(self):
+        self._by_size = {}         # 大小 -> [(key, path), ...] 各内容的代表文件
+        self._partial = {}         # path -> 部分哈希
+        self._full = {}            # path -> 全文件哈希
+        self._unreadable = set()   # prepare 时读取失败的 path（match 会再次读取并按新内容处理）
+        self.duplicates = 0
+
+    def _partial_of(self, path, size):
+        if path not in self._partial:
+            self._partial[path] = partial_digest(path, size)
+        return self._partial[path]
+
+    def _full_of(self, path):
+        if path not in self._full:
+            self._full[path] = full_digest(path)
+        return self._full[path]
+
+    def ready(self, path, size):
+        """match 所需的哈希是否都已缓存（为 True 时 match 不会读取文件）"""
+        group = self._by_size.get(size)
+        if not group:
+            return True            # 大小唯一：无需任何读取
+        paths = [path] + [other for _, other in group]
+        if any(p in self._unreadable for p in paths):
+            return True
+        if any(p not in self._partial for p in paths):
+            return False
+        same = [p for p in paths[1:] if self._partial[p] == self._partial[path]]
+        return not same or all(p in self._full for p in same + [path])
+
+    def prepare(self, path, size):
+        """计算 match 所需的部分哈希与全文件哈希并缓存（耗时的读取都在这里完成，可在工作线程中调用）"""
+        try:
+            mine = self._partial_of(path, size)
+            for _, other in list(self._by_size.get(size, ())):
+                if self._partial_of(other, size) == mine:
+                    self._full_of(other)
+                    self._full_of(path)
+        except OSError:
+            self._unreadable.add(path)
+
+    def match(self, key, path, size):
+        """
+        查找与 path 内容相同的代表文件
+        :return: 代表文件的 key；没有时把 (key, path) 登记为新的代表文件并返回 None
+        """
+        group = self._by_size.setdefault(size, [])
+        try:
+            for other_key, other_path in group:
+                if (self._partial_of(other_path, size) == self._partial_of(path, size)
+                        and self._full_of(other_path) == self._full_of(path)):
+                    self.duplicates += 1
+                    return other_key
+        except OSError:
+            return None            # 读取失败（如文件已被移走），交给转换阶段报告错误
+        group.append((key, path))
+        return None
+
+    def discard(self, key):
+        """移除代表文件（其转换失败时调用），之后相同内容的文件会登记为新的代表文件"""
+        for size, group in self._by_size.items():
+            for entry in group:
+                if entry[0] == key:
+                    group.remove(entry)
+                    return
+
+def _reflink(src, dst):
+    import fcntl                   # 仅 POSIX 可用，Windows 下 ImportError 时回退为复制
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+def materialize(src, dst, tmp, mode="hardlink"):
+    """
+    以 src 的内容生成 dst：先写入临时文件 tmp，再原子替换
+    - mode: hardlink（硬链接 → reflink → 复制）/ reflink（reflink → 复制）/ copy
+    :return: 实际使用的方式
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    methods = LINK_MODES[LINK_MODES.index(mode):]
+    for method in methods:
+        try:
+            tmp.unlink(missing_ok=True)
+            if method == "hardlink":
+                os.link(src, tmp)
+            elif method == "reflink":
+                _reflink(src, tmp)
+            else:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+            return method
+        except (OSError, ImportError):
+            tmp.unlink(missing_ok=True)
+            if method == methods[-1]:
+                raise
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 流式文件发现模块。
+原先的 list(src_path.rglob("*.mp4")) 需要遍历完整个目录树才能开始第一次转换，
+在挂载了数百万文件的 NFS 共享上会有数分钟的空等，并且要在内存中保存全部 Path 对象。
+本模块改为基于 os.scandir 的生成器，并由后台线程通过有界队列把结果交给转换阶段：
+1、边扫描边转换：发现第一个文件后即可开始转换。
+2、内存有界：队列满时扫描线程自动等待，不会无限堆积。
+3、容错：无权限或扫描途中消失的目录只记录警告，不会中断整个任务。
+4、文件列表：FileListWorker 以调用方给出的文件（可为惰性迭代器）代替目录扫描，供嵌入式 API 使用。
+"""
+
+import os
+import queue
+import threading
+from pathlib import Path
+
+def iter_files(root, suffix=".mp4", on_error=None):
+    """
+    基于 os.scandir 的递归遍历（非递归实现，避免深层目录触发递归上限）
+    - suffix: 文件后缀（按平台规则比较大小写，与 rglob 行为一致）
+    - on_error: 目录读取失败时的回调 on_error(path, exc)
+    :yield: (Path, os.stat_result)
+    """
+    suffix = os.path.normcase(suffix)
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            if on_error:
+                on_error(current, e)
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif os.path.normcase(entry.name).endswith(suffix) and entry.is_file():
+                    yield Path(entry.path), entry.stat()
+            except OSError as e:
+                if on_error:
+                    on_error(entry.path, e)
+        # 逆序入栈，保证按字母顺序深度优先遍历
+        stack.extend(reversed(subdirs))
+
+class DiscoveryWorker:
+    """
+    后台扫描线程：把 iter_files 的结果放入有界队列
+    用法:
+        worker = DiscoveryWorker(src_path).start()
+        for item in worker.drain(block=True): ...
+        worker.done  # 扫描是否已结束
+    """
+    _SENTINEL = object()
+
+    def __init__(self, root, suffix=".mp4", maxsize=1024, on_error=None):
+        self.root = root
+        self.suffix = suffix
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.found = 0
+        self.done = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mp4-discovery", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, item):
+        # 队列满时定期检查停止信号，避免主线程退出后扫描线程永久阻塞
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_items(self):
+        return iter_files(self.root, self.suffix, self.on_error)
+
+    def _run(self):
+        try:
+            for item in self._iter_items():
+                if not self._put(item):
+                    return
+        finally:
+            self._put(self._SENTINEL)
+
+    def drain(self, block=False, timeout=None, limit=None):
+        """
+        取出当前已发现的文件
+        - block: 队列为空时是否等待（至多 timeout 秒）
+        - limit: 最多取出的数量
+        """
+        items = []
+        while not self.done and (limit is None or len(items) < limit):
+            try:
+                item = self.queue.get(block=block and not items, timeout=timeout)
+            except queue.Empty:
+                break
+            if item is self._SENTINEL:
+                self.done = True
+                break
+            self.found += 1
+            items.append(item)
+        return items
+
+class FileListWorker(DiscoveryWorker):
+    """
+    以给定的文件列表代替目录扫描（接口同 DiscoveryWorker）
+    - files: 可迭代的文件路径，须位于 root 之下（输出按相对 root 的路径重建目录结构）
+    不存在、不是文件或不在 root 之下的路径通过 on_error 报告后跳过
+    """
+
+    def __init__(self, root, files, suffix=".mp4", maxsize=1024, on_error=None):
+        super().__init__(root, suffix, maxsize, on_error)
+        self.files = files
+
+    def _iter_items(self):
+        root = Path(self.root)
+        for file in self.files:
+            path = Path(file).absolute()
+            try:
+                # 与源根目录一样解析上级目录中的符号链接，文件本身若是链接则保留原名
+                path = path.parent.resolve() / path.name
+                if root not in path.parents:
+                    raise ValueError(f"不在源目录 {root} 之下")
+                st = path.stat()
+                if not os.path.isfile(path):
+                    raise OSError("不是普通文件")
+            except (OSError, ValueError) as e:
+                if self.on_error:
+                    self.on_error(str(path), e)
+                continue
+            yield path, st
@@ -20,6 +20,9 @@ Description: 自动安装缺失 Python 包的便捷工具函数（国内清华
 
 import sys
 import subprocess
+import importlib.util
+
+PIP_INDEX_URL = "https://pypi.tuna.tsinghua.edu.cn/simple"  # 清华镜像（env_manager 创建虚拟环境时安装基础依赖也使用该源）
 
 def pip(pip_pkg, import_name=None, sub_import=None):
     """
@@ -30,6 +33,11 @@ def pip(pip_pkg, import_name=None, sub_import=None):
     """
     if import_name is None:
         import_name = pip_pkg
+    # 快速路径：已导入，或只检查顶层模块时用 find_spec 判断（不执行模块代码）
+    if sub_import is None and import_name in sys.modules:
+        return
+    if sub_import is None and "." not in import_name and importlib.util.find_spec(import_name) is not None:
+        return
     try:
         # 支持深层路径：逐步导入子模块
         parts = import_name.split('.')
@@ -44,7 +52,7 @@ def pip(pip_pkg, import_name=None, sub_import=None):
         subprocess.check_call([
             sys.executable, "-m", "pip", "install",
             "--upgrade", pip_pkg,
-            "-i", "https://pypi.tuna.tsinghua.edu.cn/simple",
+            "-i", PIP_INDEX_URL,
             "--quiet"
         ])
         print(f"✅ {pip_pkg} 安装完成！")
@@ -65,7 +73,7 @@ def pip_v(pkg, version=None):
         subprocess.check_call([
             sys.executable, "-m", "pip", "install",
             install_str,
-            "-i", "https://pypi.tuna.tsinghua.edu.cn/simple",
+            "-i", PIP_INDEX_URL,
             "--quiet"
         ])
         print(f"✅ {pkg} 安装完成！")
\ No newline at end of file
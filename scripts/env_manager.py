@@ -7,37 +7,71 @@ Author: 王岷瑞/https://github.com/wangminrui2022
 License: Apache License
 Description: 这段代码是一个 Python 脚本的环境初始化与自动化配置模块。
 它主要用于确保程序在正确的 Python 版本和虚拟环境中运行，并能根据用户的硬件（特别是 NVIDIA GPU）自动安装适配的 PyTorch 及其相关音频处理依赖。
-该脚本充当了程序的“引导加载程序”（Bootstrapper），主要完成以下四项任务：
-1、路径与日志管理：整合项目路径配置并初始化日志系统。
+该脚本充当了程序的“引导加载程序”（Bootstrapper），主要完成以下几项任务：
+1、路径与日志管理：整合项目路径配置并初始化日志系统（路径信息只在冷启动时打印）。
 2、环境强制检查：严格限制 Python 运行版本（3.10 ~ 3.12）。
-3、智能硬件探测：通过解析 nvidia-smi 自动识别 GPU、驱动版本及 CUDA 版本。
-4、自动化依赖部署：根据硬件情况，自动安装对应版本的 PyTorch（GPU/CPU 版）及音频处理库（audio-separator, librosa 等）。
+3、依赖档位：默认 minimal 档位只安装 tqdm（纯 FFmpeg 转换无需其他依赖）；ml 档位需通过 --profile ml 或环境变量 MP4_EXTRACTOR_PROFILE=ml 显式开启。
+4、智能硬件探测（仅 ml 档位）：通过解析 nvidia-smi 自动识别 GPU、驱动版本及 CUDA 版本。
+5、自动化依赖部署（仅 ml 档位）：根据硬件情况，自动安装对应版本的 PyTorch（GPU/CPU 版）及音频处理库（audio-separator, librosa 等）。
+6、环境指纹缓存：冷启动校验通过后记录解释器与已安装包集合的指纹，热启动时跳过全部检查；POSIX 下切换解释器使用 exec 替换进程，不再叠加一个等待中的父进程。
+7、轻量导入：本模块只依赖标准库与 config，日志系统在冷启动需要时才初始化；主脚本应在导入其余模块之前调用 bootstrap，
+   热启动切换解释器时不会先加载整套转换模块、也不会启动日志线程。
 """
 
 import os
 import sys
+import json
+import logging
+import hashlib
 import subprocess
-import venv
 import shutil
 import re
+import sysconfig
 from pathlib import Path
-from logger_manager import LoggerManager
+from ensure_package import PIP_INDEX_URL
 from config import ProjectPaths,SCRIPT_PATH, SKILL_ROOT,VENV_DIR,LOG_DIR,MODEL_DIR
 
-# 方式 A：直接使用导出的常量
-print(f"代码目录: {SCRIPT_PATH}")
-print(f"根目录是: {SKILL_ROOT}")
-print(f"虚拟环境路径: {VENV_DIR}")
-print(f"日志路径: {LOG_DIR}")
-print(f"模型路径: {MODEL_DIR}")
+def print_paths():
+    """打印项目路径配置（只在冷启动时调用，避免每次 import 都产生输出）"""
+    # 方式 A：直接使用导出的常量
+    print(f"代码目录: {SCRIPT_PATH}")
+    print(f"根目录是: {SKILL_ROOT}")
+    print(f"虚拟环境路径: {VENV_DIR}")
+    print(f"日志路径: {LOG_DIR}")
+    print(f"模型路径: {MODEL_DIR}")
 
-# 方式 B：使用辅助方法获取更深的路径
-model_path = ProjectPaths.get_subpath("models", "v1", "model.pkl")
-print(f"模型保存路径: {model_path}")
+    # 方式 B：使用辅助方法获取更深的路径
+    model_path = ProjectPaths.get_subpath("models", "v1", "model.pkl")
+    print(f"模型保存路径: {model_path}")
 
-# --- 日志系统初始化 ---
-# 将配置好的 LOG_DIR 传给 LoggerManager
-logger = LoggerManager.setup_logger(logger_name="mp4-to-mp3-extractor")
+# --- 日志系统 ---
+# 热启动只做指纹校验与解释器切换，不初始化日志系统（不启动日志线程）；冷启动时由 _setup_logging 配置
+logger = logging.getLogger("mp4-to-mp3-extractor")
+
+def _setup_logging():
+    """初始化日志系统（将配置好的 LOG_DIR 传给 LoggerManager；已初始化时不重复配置）"""
+    from logger_manager import LoggerManager
+    LoggerManager.setup_logger(logger_name="mp4-to-mp3-extractor")
+
+# --- 依赖档位 ---
+# minimal：纯 MP4→MP3 转换（默认），只安装 tqdm，新节点冷启动只需数秒
+# ml：在 minimal 基础上安装 PyTorch / audio-separator / librosa 等重型依赖（约 3GB）
+PROFILE_ENV = "MP4_EXTRACTOR_PROFILE"
+DEFAULT_PROFILE = "minimal"
+PROFILES = {
+    "minimal": ["tqdm"],
+    "ml": ["torch", "torchvision", "torchaudio", "audio-separator", "librosa", "pydub", "huggingface-hub[tqdm]"],
+}
+PROFILE_DEPENDS = {
+    "ml": ("minimal",),
+}
+PROFILE_MARKER = VENV_DIR / ".mp4_extractor_profiles"
+
+# --- 环境指纹缓存 ---
+# 冷启动校验通过后记录：解释器路径/版本/文件信息、site-packages 中的已安装包集合、已安装档位。
+# 热启动时只需一次 stat 和一次 listdir 即可确认环境未变化，跳过所有检查。
+FINGERPRINT_FILE = VENV_DIR / ".mp4_extractor_env.json"
+FINGERPRINT_VERSION = 1
 
 def check_python_version():
     """严格检测 Python 版本，只支持 3.10 ~ 3.12"""
@@ -52,129 +86,254 @@ def check_python_version():
     logger.info(f"✅ Python 版本检测通过: {major}.{minor}")
 
 
-def setup_venv():
-    """自动创建虚拟环境 + 切换到 venv 执行主脚本（强化防递归 + 绝对路径版）"""
-    
+def _venv_python():
+    """虚拟环境中的 python 解释器路径"""
+    if os.name == "nt":  # Windows
+        return VENV_DIR / "Scripts" / "python.exe"
+    return VENV_DIR / "bin" / "python"
+
+def _installed_profiles():
+    """读取虚拟环境中已安装的依赖档位（记录在 PROFILE_MARKER 中）"""
+    try:
+        return set(PROFILE_MARKER.read_text(encoding="utf-8").split())
+    except OSError:
+        return set()
+
+def _mark_profile_installed(profile):
+    profiles = _installed_profiles() | {profile}
+    PROFILE_MARKER.write_text("\n".join(sorted(profiles)), encoding="utf-8")
+
+def _package_set_key(site_packages):
+    """已安装包集合的摘要（基于 site-packages 下的 *.dist-info 目录名，包含版本号）"""
+    try:
+        names = sorted(n for n in os.listdir(site_packages) if n.endswith(".dist-info"))
+    except OSError:
+        return None
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+def _interpreter_key(python_path):
+    """解释器文件信息（基础 Python 被升级或替换后指纹自动失效）"""
+    try:
+        st = Path(python_path).resolve().stat()
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def _running_in_venv_interpreter():
+    """当前解释器是否就是虚拟环境的解释器（按 sys.prefix 判断，不受符号链接影响）"""
+    try:
+        return Path(sys.prefix).resolve() == VENV_DIR.resolve()
+    except OSError:
+        return False
+
+def save_fingerprint():
+    """在虚拟环境解释器中调用：记录当前已校验通过的环境"""
+    if not _running_in_venv_interpreter():
+        return
+    site_packages = sysconfig.get_paths()["purelib"]
+    data = {
+        "version": FINGERPRINT_VERSION,
+        "interpreter": str(_venv_python()),
+        "interpreter_key": _interpreter_key(_venv_python()),
+        "python_version": list(sys.version_info[:3]),
+        "site_packages": site_packages,
+        "packages_key": _package_set_key(site_packages),
+        "profiles": sorted(_installed_profiles()),
+    }
+    try:
+        tmp_path = FINGERPRINT_FILE.with_name(FINGERPRINT_FILE.name + ".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, FINGERPRINT_FILE)
+    except OSError as e:
+        logger.warning(f"环境指纹写入失败（不影响运行）: {e}")
+
+def fingerprint_valid(profile):
+    """热启动判断：指纹存在、档位已安装、解释器与已安装包集合均未变化"""
+    try:
+        data = json.loads(FINGERPRINT_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    if data.get("version") != FINGERPRINT_VERSION or profile not in data.get("profiles", []):
+        return False
+    major, minor = (data.get("python_version") or [0, 0])[:2]
+    if major != 3 or minor < 10 or minor > 12:
+        return False
+    if data.get("interpreter") != str(_venv_python()):
+        return False
+    if data.get("interpreter_key") is None or data.get("interpreter_key") != _interpreter_key(data["interpreter"]):
+        return False
+    return data.get("packages_key") is not None and data["packages_key"] == _package_set_key(data["site_packages"])
+
+def resolve_profile(profile=None):
+    """依赖档位优先级：参数 > 环境变量 MP4_EXTRACTOR_PROFILE > 默认 minimal"""
+    profile = (profile or os.getenv(PROFILE_ENV) or DEFAULT_PROFILE).strip().lower()
+    if profile not in PROFILES:
+        logger.error(f"未知的依赖档位: {profile}（可选: {', '.join(PROFILES)}）")
+        sys.exit(1)
+    return profile
+
+def detect_gpu():
+    """
+    修复版 GPU 检测（解析完整 nvidia-smi）
+    :return: (has_gpu, cuda_ver, driver)
+    """
+    logger.info("检测 GPU 和 CUDA 版本...")
+    has_gpu = False
+    cuda_ver = "unknown"
+    driver = "unknown"
+
+    nvidia_smi_path = shutil.which("nvidia-smi")
+    if not nvidia_smi_path:
+        possible_paths = [
+            r"C:\Windows\System32\nvidia-smi.exe",  # 你的路径
+            r"C:\Program Files\NVIDIA Corporation\NVSMI\nvidia-smi.exe",
+            "/usr/bin/nvidia-smi",  # Ubuntu
+            "/usr/local/cuda/bin/nvidia-smi",
+        ]
+        for p in possible_paths:
+            if os.path.exists(p):
+                nvidia_smi_path = p
+                break
+
+    if nvidia_smi_path:
+        try:
+            # 运行完整 nvidia-smi 并解析输出
+            result = subprocess.run(
+                [nvidia_smi_path],
+                capture_output=True, text=True, timeout=10
+            )
+            if result.returncode == 0 and result.stdout:
+                output = result.stdout
+                # 提取 Driver Version
+                driver_match = re.search(r"Driver Version:\s*([\d.]+)", output)
+                if driver_match:
+                    driver = driver_match.group(1)
+                # 提取 CUDA Version
+                cuda_match = re.search(r"CUDA Version:\s*([\d.]+)", output)
+                if cuda_match:
+                    cuda_ver = cuda_match.group(1)
+                # 提取 GPU Name（确认有 GPU）
+                if "NVIDIA" in output and cuda_ver != "unknown":
+                    has_gpu = True
+                    #has_gpu = False#FFmpeg使用CPU即可
+                    logger.info(f"✅ 检测到 NVIDIA GPU！驱动: {driver}，CUDA: {cuda_ver}")
+        except Exception as e:
+            logger.warning(f"nvidia-smi 执行失败: {e}")
+    return has_gpu, cuda_ver, driver
+
+def _install_minimal(venv_python):
+    """minimal 档位：纯 MP4→MP3 转换只需要 tqdm，重活全部交给外部 ffmpeg（与 ensure_package 使用同一镜像源）"""
+    logger.info(f"安装基础依赖: {' '.join(PROFILES['minimal'])}")
+    subprocess.check_call([str(venv_python), "-m", "pip", "install", "--quiet",
+                           "-i", PIP_INDEX_URL, *PROFILES["minimal"]])
+
+def _install_ml(venv_python):
+    """ml 档位：GPU 检测 + PyTorch + audio-separator 等重型依赖（约 3GB，按需开启）"""
+    logger.info("正在升级 pip...")
+    subprocess.check_call([str(venv_python), "-m", "pip", "install", "--upgrade", "pip"])
+
+    has_gpu, cuda_ver, driver = detect_gpu()
+
+    # ==================== 根据 CUDA 版本选 wheel ====================
+    index_url = "https://download.pytorch.org/whl/cpu"  # 默认 CPU
+    use_gpu = False
+    if has_gpu:
+        major_minor = '.'.join(cuda_ver.split('.')[:2])
+        cuda_map = {
+            "12.6": "cu126",
+            "12.7": "cu126",
+            "12.8": "cu128",
+            "12.9": "cu128",
+            "13.0": "cu121",  # 兼容 13.x
+            "13.1": "cu121",  # ← 你的 13.1 走这里（官方推荐，稳定兼容）
+        }
+        wheel = cuda_map.get(major_minor, "cu121")  # 默认 cu121 for 13+
+        index_url = f"https://download.pytorch.org/whl/{wheel}"
+        use_gpu = True
+        logger.info(f"🎯 CUDA {cuda_ver} → 使用 {wheel} GPU 加速版")
+
+    else:
+        logger.info("ℹ️ 未检测到 GPU，使用 CPU 版")
+
+    # 安装 PyTorch
+    logger.info("正在安装 PyTorch（~2-3GB，请耐心等待）...")
+    subprocess.check_call([
+        str(venv_python), "-m", "pip", "install", "torch", "torchvision", "torchaudio",
+        "--index-url", index_url
+    ])
+
+    # 验证
+    verify = subprocess.run([
+        str(venv_python), "-c",
+        "import torch; "
+        "print('GPU可用' if torch.cuda.is_available() else '仅CPU'); "
+        "print('设备:', torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'CPU')"
+    ], capture_output=True, text=True, timeout=30)
+    logger.info(f"PyTorch 验证结果: {verify.stdout.strip()}")
+
+    # 安装 audio-separator + librosa（你提到的）
+    if use_gpu:
+        logger.info("安装 audio-separator GPU 版 + librosa...")
+        subprocess.check_call([str(venv_python), "-m", "pip", "install", "audio-separator[gpu]", "librosa"])
+    else:
+        logger.info("安装 audio-separator CPU 版 + librosa...")
+        subprocess.check_call([str(venv_python), "-m", "pip", "install", "audio-separator[cpu]", "librosa"])
+
+    subprocess.check_call([str(venv_python), "-m", "pip", "install", "pydub"])
+    subprocess.check_call([str(venv_python), "-m", "pip", "install", "huggingface-hub[tqdm]"])
+
+PROFILE_INSTALLERS = {
+    "minimal": _install_minimal,
+    "ml": _install_ml,
+}
+
+def install_profile(venv_python, profile):
+    """按档位安装依赖；已安装过的档位直接跳过（只读取一个标记文件）"""
+    if profile in _installed_profiles():
+        return
+    for name in PROFILE_DEPENDS.get(profile, ()) + (profile,):
+        if name in _installed_profiles():
+            continue
+        logger.info(f"正在安装依赖档位: {name}")
+        PROFILE_INSTALLERS[name](venv_python)
+        _mark_profile_installed(name)
+    logger.info(f"✅ 依赖档位 {profile} 安装完成！")
+
+def setup_venv(profile=None):
+    """
+    自动创建虚拟环境 + 切换到 venv 执行主脚本（强化防递归 + 绝对路径版）
+    - profile: 依赖档位，minimal（默认，仅 tqdm）或 ml（PyTorch / audio-separator 等重型依赖）
+    """
+    _setup_logging()
+    profile = resolve_profile(profile)
+
     # ==================== 防递归保护 ====================
     if os.getenv("RUNNING_IN_VENV") == "true":
         logger.info(f"✅ 已成功在虚拟环境中运行: {sys.executable}")
         return
 
     # 确定虚拟环境 python 路径
-    if os.name == "nt":  # Windows
-        venv_python = VENV_DIR / "Scripts" / "python.exe"
-    else:
-        venv_python = VENV_DIR / "bin" / "python"
+    venv_python = _venv_python()
 
     # 当前已经在虚拟环境中（大小写不敏感）
     if Path(sys.executable).resolve() == venv_python.resolve():
         logger.info(f"✅ 当前已在虚拟环境中运行")
+        install_profile(venv_python, profile)
         os.environ["RUNNING_IN_VENV"] = "true"
         return
 
-    # ==================== 创建虚拟环境 + 安装依赖（保留你原来的全部逻辑） ====================
+    # ==================== 创建虚拟环境 + 按档位安装依赖 ====================
     if not VENV_DIR.exists():
+        import venv
         logger.info(f"正在创建虚拟环境: {VENV_DIR}")
         venv.create(VENV_DIR, with_pip=True)
         logger.info("虚拟环境创建成功")
 
-        logger.info("正在升级 pip...")
-        subprocess.check_call([str(venv_python), "-m", "pip", "install", "--upgrade", "pip"])
-
-    # ==================== 修复版 GPU 检测（解析完整 nvidia-smi） ====================
-        logger.info("检测 GPU 和 CUDA 版本...")
-        has_gpu = False
-        cuda_ver = "unknown"
-        driver = "unknown"
-
-        nvidia_smi_path = shutil.which("nvidia-smi")
-        if not nvidia_smi_path:
-            possible_paths = [
-                r"C:\Windows\System32\nvidia-smi.exe",  # 你的路径
-                r"C:\Program Files\NVIDIA Corporation\NVSMI\nvidia-smi.exe",
-                "/usr/bin/nvidia-smi",  # Ubuntu
-                "/usr/local/cuda/bin/nvidia-smi",
-            ]
-            for p in possible_paths:
-                if os.path.exists(p):
-                    nvidia_smi_path = p
-                    break
-
-        if nvidia_smi_path:
-            try:
-                # 运行完整 nvidia-smi 并解析输出
-                result = subprocess.run(
-                    [nvidia_smi_path],
-                    capture_output=True, text=True, timeout=10
-                )
-                if result.returncode == 0 and result.stdout:
-                    output = result.stdout
-                    # 提取 Driver Version
-                    driver_match = re.search(r"Driver Version:\s*([\d.]+)", output)
-                    if driver_match:
-                        driver = driver_match.group(1)
-                    # 提取 CUDA Version
-                    cuda_match = re.search(r"CUDA Version:\s*([\d.]+)", output)
-                    if cuda_match:
-                        cuda_ver = cuda_match.group(1)
-                    # 提取 GPU Name（确认有 GPU）
-                    if "NVIDIA" in output and cuda_ver != "unknown":
-                        has_gpu = True
-                        #has_gpu = False#FFmpeg使用CPU即可
-                        logger.info(f"✅ 检测到 NVIDIA GPU！驱动: {driver}，CUDA: {cuda_ver}")
-            except Exception as e:
-                logger.warning(f"nvidia-smi 执行失败: {e}")
-
-        # ==================== 根据 CUDA 版本选 wheel ====================
-        index_url = "https://download.pytorch.org/whl/cpu"  # 默认 CPU
-        use_gpu = False
-        if has_gpu:
-            major_minor = '.'.join(cuda_ver.split('.')[:2])
-            cuda_map = {
-                "12.6": "cu126",
-                "12.7": "cu126",
-                "12.8": "cu128",
-                "12.9": "cu128",
-                "13.0": "cu121",  # 兼容 13.x
-                "13.1": "cu121",  # ← 你的 13.1 走这里（官方推荐，稳定兼容）
-            }
-            wheel = cuda_map.get(major_minor, "cu121")  # 默认 cu121 for 13+
-            index_url = f"https://download.pytorch.org/whl/{wheel}"
-            use_gpu = True
-            logger.info(f"🎯 CUDA {cuda_ver} → 使用 {wheel} GPU 加速版")
-
-        else:
-            logger.info("ℹ️ 未检测到 GPU，使用 CPU 版")
-
-        # 安装 PyTorch
-        logger.info("正在安装 PyTorch（~2-3GB，请耐心等待）...")
-        subprocess.check_call([
-            str(venv_python), "-m", "pip", "install", "torch", "torchvision", "torchaudio",
-            "--index-url", index_url
-        ])
-
-        # 验证
-        verify = subprocess.run([
-            str(venv_python), "-c",
-            "import torch; "
-            "print('GPU可用' if torch.cuda.is_available() else '仅CPU'); "
-            "print('设备:', torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'CPU')"
-        ], capture_output=True, text=True, timeout=30)
-        logger.info(f"PyTorch 验证结果: {verify.stdout.strip()}")
-
-        # 安装 audio-separator + librosa（你提到的）
-        if use_gpu:
-            logger.info("安装 audio-separator GPU 版 + librosa...")
-            subprocess.check_call([str(venv_python), "-m", "pip", "install", "audio-separator[gpu]", "librosa"])
-        else:
-            logger.info("安装 audio-separator CPU 版 + librosa...")
-            subprocess.check_call([str(venv_python), "-m", "pip", "install", "audio-separator[cpu]", "librosa"])
-
-        subprocess.check_call([str(venv_python), "-m", "pip", "install", "pydub"])
-        subprocess.check_call([str(venv_python), "-m", "pip", "install", "huggingface-hub[tqdm]"])
-        
-        logger.info("✅ 虚拟环境及所有依赖安装完成！")
+    install_profile(venv_python, profile)
+    _reexec_in_venv(venv_python)
 
+def _reexec_in_venv(venv_python):
+    """切换到虚拟环境解释器重新执行主脚本（不返回）"""
     # ==================== 关键修复：重新启动主脚本 ====================
     logger.info("🔄 正在切换到虚拟环境重新执行脚本...")
 
@@ -207,11 +366,53 @@ def setup_venv():
     logger.info(f"   目标Python: {venv_python}")
     logger.info(f"   主脚本路径: {main_script}")
 
-    # 启动新进程（保持当前工作目录）
+    # POSIX 下直接用 execve 替换当前进程，不再保留一个等待子进程的父解释器
+    if os.name != "nt":
+        logger_manager = sys.modules.get("logger_manager")
+        if logger_manager is not None:    # execve 不会执行 atexit，先输出队列中剩余的日志
+            logger_manager.LoggerManager.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execve(str(venv_python), [str(venv_python), str(main_script)] + sys.argv[1:], env)
+
+    # Windows 的 exec 语义与 POSIX 不同，仍使用子进程方式（保持当前工作目录）
     result = subprocess.run(
         [str(venv_python), str(main_script)] + sys.argv[1:],
         env=env,
         cwd=Path.cwd(),      # ← 关键！保证相对路径正确
     )
 
-    sys.exit(result.returncode)
\ No newline at end of file
+    sys.exit(result.returncode)
+
+def profile_from_argv(argv):
+    """
+    从命令行参数中取出 --profile（bootstrap 在解析完整参数之前执行，只需要这一项）
+    其余参数原样保留，由主脚本切换解释器后再完整解析
+    """
+    import argparse
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", default=None)
+    known, _ = parser.parse_known_args(argv)
+    return known.profile
+
+def bootstrap(profile=None):
+    """
+    启动入口：版本检查 + 虚拟环境 + 环境指纹缓存（主脚本应在导入其余模块之前调用）
+    - 热启动（指纹有效）：跳过版本检查与依赖检测；已在虚拟环境中时直接返回，否则直接切换解释器
+    - 冷启动：执行完整检查，并在虚拟环境解释器中记录指纹供下次使用
+    """
+    profile = resolve_profile(profile)
+    in_venv = os.getenv("RUNNING_IN_VENV") == "true" or _running_in_venv_interpreter()
+
+    if fingerprint_valid(profile):
+        if in_venv:
+            os.environ["RUNNING_IN_VENV"] = "true"
+            return
+        _reexec_in_venv(_venv_python())
+
+    _setup_logging()
+    print_paths()
+    check_python_version()
+    setup_venv(profile)
+    # 走到这里说明当前已在虚拟环境中运行
+    save_fingerprint()
@@ -8,104 +8,1257 @@ License: Apache License
 Description: 这段代码是一个基于 Python 的自动化视频转音频（MP4 转 MP3）提取工具。
 它不仅实现了核心的转换功能，还集成了一套生产级的环境管理和日志监控机制。
 1、该程序的主要任务是遍历指定的源目录，将其中的所有 .mp4 视频文件通过 FFmpeg 工具提取为高质量的 .mp3 音频文件（192kbps），并保持原有的目录结构输出到目标文件夹。
-2、鲁棒的日志系统：通过 LoggerManager 实现结构化日志记录，包含任务开始、扫描进度、处理状态及最终汇总，便于无人值守时排查问题。
-3、环境自动管理：在执行前调用 env_manager 检查 Python 版本并自动设置虚拟环境（venv），甚至包含 GPU 硬件检测的预处理。
-4、递归处理与结构保持：使用 pathlib 模块进行递归扫描（rglob），确保子文件夹中的视频也能被发现，并在目标路径下重建相同的子目录结构。
-5、错误容错机制：采用 try-except 捕获单文件处理中的异常，确保某个文件损坏或转换失败时，程序不会崩溃，而是继续处理下一个任务。
-6、非阻塞式命令执行：使用 subprocess.run 调用系统级 FFmpeg，并实时捕获错误输出（stderr）以便在日志中记录具体的转换失败原因。
+2、鲁棒的日志系统：通过 LoggerManager 实现结构化日志记录，包含任务开始、扫描进度、处理状态及最终汇总，便于无人值守时排查问题；
+   日志经队列交给后台线程写入，不阻塞转换；--log-format json 时日志文件为 JSON Lines，逐文件记录 path / duration / returncode。
+3、环境自动管理：在执行前调用 env_manager 检查 Python 版本并自动设置虚拟环境（venv）；默认只安装最小依赖，--profile ml 时才安装 PyTorch 等重型依赖并进行 GPU 硬件检测。
+4、递归处理与结构保持：使用基于 os.scandir 的流式扫描（后台线程 + 有界队列），边扫描边转换，确保子文件夹中的视频也能被发现，并在目标路径下重建相同的子目录结构。
+5、并发转换：通过 --jobs 指定并发的 FFmpeg 进程数（默认等于 CPU 核心数），并按媒体时长从长到短调度，避免超长文件拖尾。
+6、流复制快速通道：先用 ffprobe 探测音频编码，MP3 音频（以及开启 --copy-aac 时的 AAC 音频）直接 -c:a copy 无损提取，其余重新编码。
+7、错误容错机制：采用 try-except 捕获单文件处理中的异常，确保某个文件损坏或转换失败时，程序不会崩溃，而是继续处理下一个任务。
+8、非阻塞式命令执行：调用系统级 FFmpeg，通过 -progress pipe:1 实时读取进度（进度条按媒体时间推进），stderr 只保留末尾若干行用于记录失败原因。
+9、增量重跑：输出目录下维护转换清单（manifest），源文件与编码参数未变化时自动跳过，--force 可强制重新转换。
+10、运行遥测：记录每个文件的排队等待、耗时、输入/输出字节、媒体时长与实时倍率，输出到 JSON Lines（可选 Prometheus textfile），并汇总 p50/p95/p99 与最慢文件。
+11、多规格输出：--renditions "64k,192k,opus:96k" 时每个源文件只启动一个 FFmpeg 进程、只解码一次，同时写出全部规格。
+12、小文件批处理：--batch-max-bytes 开启后，多个小文件合并到一个 FFmpeg 进程中转换，整批失败时逐个重试以定位出错文件。
+13、超长文件分段并行：--segment-min-duration 开启后，时长超过阈值且需要重新编码的文件按帧对齐切段并行编码，再无缝拼接为一个 MP3。
+14、崩溃可恢复：任务状态持久化到输出目录下的 SQLite 任务表，输出先写入临时文件、成功后原子重命名；--resume 从上次中断处继续，失败文件在 --max-attempts 次以内重试。
+15、热文件夹监听：--watch 时进程常驻，通过 inotify（或定时扫描）发现新增/变化的 .mp4，文件写入稳定后立即进入转换流程。
+16、超时与取消：每个 FFmpeg 进程的超时按媒体时长折算（--timeout-factor / --timeout-min），损坏文件不会卡住整个任务；
+    Ctrl+C 或 SIGTERM 时立即结束全部 FFmpeg 子进程，并删除未完成的临时输出。
+17、内容去重：--dedup 时按 大小 → 头尾部分哈希 → 全文件哈希 逐级识别内容相同的源文件，每份内容只转换一次，其余输出以硬链接/reflink（或复制）生成。
+18、I/O 感知调度：按 st_dev 区分源/目标设备，--io-readers / --io-writers 分别限制每个设备上的并发读/写任务数（与 --jobs 无关），
+    --order path|inode 时按目录或 inode 顺序提交，减少慢速磁盘上的寻道。
+19、探测索引：转换前由独立的探测阶段批量运行 ffprobe，结果（时长、编码、声道、采样率）按 路径 + 大小 + 修改时间 缓存到输出目录，
+    没有音频流的文件直接跳过，不占用转换名额；进度条按剩余媒体秒数估算剩余时间；重跑时直接使用缓存。
+20、可嵌入 API：Extractor / iter_extract 可在常驻服务进程中直接调用，接受源目录或文件列表，逐个产出 FileResult，
+    出错时抛出 ExtractError 而不是退出进程，并可通过 cancel() 随时取消；命令行只是其上的一层薄封装。
+21、多节点分片：多个节点共享同一 src_dir / dest_dir 时，--shard I/N 按相对路径哈希分工，--lease 通过共享文件系统上的租约文件认领，
+    租约过期（节点崩溃）后由其他节点接管；各节点的清单、任务表与探测索引写入各自的文件，互不覆盖。
 """
 
 # 基础用法
 # python scripts\extract.py "F:\Videos" "F:\Audio"
 # python scripts/extract.py "/home/admin/Videos" "/home/admin/Audio"
+# python scripts/extract.py "/home/admin/Videos" "/home/admin/Audio" --jobs 8
 # .\venv\scripts\python -c "import torch; import torchvision; print(torch.__version__, torchvision.__version__)"
 # .\venv\Scripts\python -c "import torch; print('版本:', torch.__version__); print('GPU可用:', torch.cuda.is_available()); print('GPU名称:', torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'CPU')"
 
+import os
 import sys
-import subprocess
-from pathlib import Path
-from logger_manager import LoggerManager
 import env_manager
+
+if __name__ == "__main__":
+    # 必须最先执行：在导入其余模块之前完成环境检查，热启动时直接切换到虚拟环境解释器
+    # （环境指纹有效时跳过全部检查；ml 档位包含 GPU 自动检测）
+    env_manager.bootstrap(profile=env_manager.profile_from_argv(sys.argv[1:]))
+
+import heapq
+import collections
+import shutil
+import argparse
+import time
+import signal
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from logger_manager import LoggerManager, LOG_FORMATS
 import ensure_package
-ensure_package.pip("tqdm", "tqdm")
-# 现在添加所有导入语句
-from tqdm import tqdm
+from manifest import ConversionManifest, file_digest
+from probe import probe_file, choose_mode, ffprobe_available
+from probe_index import ProbeIndex, estimate_duration
+from discovery import DiscoveryWorker, FileListWorker
+from watcher import WatchWorker
+from dedup import LINK_MODES, ContentIndex, materialize
+from io_scheduler import ORDERS, DeviceLimiter, device_of, order_key
+import ffmpeg_runner
+from ffmpeg_runner import run_ffmpeg, CancelToken
+from metrics import MetricsRecorder, FileMetrics
+from renditions import Rendition, parse_renditions
+from segmenter import SegmentError, encode_segmented
+from job_queue import JobQueue, DONE, FAILED
+import sharding
+from sharding import LeaseError, LeaseManager, in_shard, parse_shard
+from config import LOG_DIR
+
+# --- 日志系统 ---
+# import 本模块不启动日志线程：命令行入口按 --log-format 初始化，嵌入调用时由 iter_extract 首次运行时初始化
+LOGGER_NAME = "mp4-to-mp3-extractor"
+logger = logging.getLogger(LOGGER_NAME)
+
+# 编码参数（同时写入转换清单，参数变化后会触发重新转换）
+ENCODE_SETTINGS = {
+    "codec": "libmp3lame",        # 使用 MP3 编码器
+    "bitrate": "192k",            # 192kbps 音质（可改成 128k / 256k）
+}
+
+@dataclass
+class ConvertOptions:
+    """转换参数（所有工作线程共享，只读）"""
+    with_hash: bool = False       # 记录源文件内容哈希
+    stream_copy: bool = True      # 允许流复制
+    copy_aac: bool = False        # AAC 音频流复制为 .m4a
+    renditions: Optional[list] = None  # 多规格输出（Rendition 列表），为 None 时按默认单一 MP3 输出
+    batch_max_bytes: int = 0      # 小文件批处理：单批输入总字节上限（0 表示关闭批处理）
+    batch_file_size: int = 8 * 1024 * 1024  # 不超过该大小的文件才参与批处理
+    batch_max_files: int = 32     # 单批文件数上限
+    segment_min_duration: float = 0.0  # 超过该时长（秒）的文件分段并行编码（0 表示关闭）
+    segment_count: int = 1        # 分段数（同时也是该文件并行编码进程数的上限）
+    timeout_factor: float = 1.0   # 超时 = timeout_min + 媒体时长 × timeout_factor（0 表示不限制）
+    timeout_min: float = 120.0    # 超时的固定部分（秒），覆盖进程启动与探测等开销
+    cancel_token: Optional[CancelToken] = None  # 所属任务的取消令牌（见 ffmpeg_runner）
+    limiter: Optional[DeviceLimiter] = None     # 共享的并发与设备名额，分段编码的额外分段从中申请（见 io_scheduler）
+    write_devices: frozenset = frozenset()      # 输出所在的设备
+
+    @property
+    def cancelled(self):
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+@dataclass
+class ConversionResult:
+    """单个文件的转换结果"""
+    ok: bool
+    error: str = ""
+    mode: str = "transcode"       # "copy"（流复制）或 "transcode"（重新编码）
+    out_files: List[Path] = field(default_factory=list)
+    digest: Optional[str] = None
+    returncode: Optional[int] = None
+    queue_wait: float = 0.0       # 提交到开始执行的等待时间（秒）
+    wall_time: float = 0.0        # 探测 + FFmpeg 的墙钟耗时（秒）
+    media_duration: Optional[float] = None
+
+def build_ffmpeg_cmd(mp4_file, out_file, mode="transcode"):
+    """构造单个文件的 FFmpeg 转换命令"""
+    # ✅ 修复后的正确命令（已测试可直接用）
+    cmd = [
+        "ffmpeg", "-y", "-i", str(mp4_file),
+        "-vn",                    # 去除视频流
+    ]
+    if mode == "copy":
+        # 音频流原样封装，不解码不编码
+        cmd += ["-map", "0:a:0", "-c:a", "copy"]
+    else:
+        cmd += ["-c:a", ENCODE_SETTINGS["codec"], "-b:a", ENCODE_SETTINGS["bitrate"]]
+    cmd += [str(out_file), "-loglevel", "error"]
+    return cmd
+
+def build_rendition_cmd(mp4_file, outputs):
+    """
+    构造多规格输出命令：一个输入、多个输出，音频只解码一次再分别送入各编码器
+    - outputs: [(输出文件, Rendition), ...]
+    """
+    cmd = ["ffmpeg", "-y", "-i", str(mp4_file)]
+    for out_file, rendition in outputs:
+        cmd += ["-vn"] + rendition.ffmpeg_args() + [str(out_file)]
+    cmd += ["-loglevel", "error"]
+    return cmd
+
+def _outputs_for(rel_path, dest_path, renditions):
+    """计算一个源文件的全部输出：[(输出文件, Rendition)]；未指定多规格时为默认 MP3 输出"""
+    if renditions:
+        return [(dest_path / r.name / rel_path.with_suffix(r.suffix), r) for r in renditions]
+    return [(dest_path / rel_path.with_suffix(".mp3"), Rendition("mp3", ENCODE_SETTINGS["bitrate"]))]
+
+def build_batch_cmd(inputs):
+    """
+    构造小文件批处理命令：一个 FFmpeg 进程带多个输入，每个输入映射到自己的输出
+    - inputs: [(源文件, [(输出文件, Rendition), ...]), ...]
+    """
+    cmd = ["ffmpeg", "-y"]
+    for mp4_file, _ in inputs:
+        cmd += ["-i", str(mp4_file)]
+    for index, (_, outputs) in enumerate(inputs):
+        for out_file, rendition in outputs:
+            cmd += ["-vn"] + rendition.ffmpeg_args(index) + [str(out_file)]
+    cmd += ["-loglevel", "error"]
+    return cmd
+
+def _partial_path(out_file):
+    """输出文件的临时名（隐藏文件，保留后缀以便 FFmpeg 按后缀选择封装格式）"""
+    return out_file.with_name(f".{out_file.stem}.partial{out_file.suffix}")
+
+def _finish_outputs(out_files, ok):
+    """成功时把临时文件原子重命名为正式输出，失败时删除临时文件，不留下半成品"""
+    for out_file in out_files:
+        if ok:
+            os.replace(_partial_path(out_file), out_file)
+        else:
+            _partial_path(out_file).unlink(missing_ok=True)
+
+def _timeout_for(duration, size, options):
+    """
+    按媒体时长折算 FFmpeg 超时（秒）；时长未知（探测失败或批处理）时由文件大小估算时长
+    """
+    if not options.timeout_factor:
+        return None
+    if not duration:
+        duration = estimate_duration(size)
+    return options.timeout_min + duration * options.timeout_factor
+
+def _run_conversion(cmd, out_files, on_progress=None, timeout=None, token=None):
+    """执行已指向临时文件的转换命令（见 _partial_path），结束后提交或清理输出"""
+    for out_file in out_files:
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # 逐行读取进度，stderr 只保留末尾若干行，避免 ffmpeg 日志刷屏或占满内存
+    try:
+        returncode, stderr, media_seconds = run_ffmpeg(cmd, on_progress, timeout, token)
+    except BaseException:
+        _finish_outputs(out_files, False)
+        raise
+    _finish_outputs(out_files, returncode == 0)
+    return returncode, ("" if returncode == 0 else stderr), media_seconds
+
+def convert_file(mp4_file, out_file, mode="transcode", on_progress=None, timeout=None, token=None):
+    """
+    转换单个文件（在工作线程中执行）
+    FFmpeg 本身运行在独立子进程中，线程只负责等待，因此不受 GIL 限制。
+    - on_progress: 回调 on_progress(已处理媒体秒数)，由 -progress pipe:1 实时驱动
+    - timeout: 超时秒数，超时后强制结束 FFmpeg 并返回失败
+    - token: 所属任务的 CancelToken，取消时结束 FFmpeg 并返回失败
+    :return: (返回码, 错误信息, 已处理媒体秒数)
+    """
+    cmd = build_ffmpeg_cmd(mp4_file, _partial_path(out_file), mode)
+    return _run_conversion(cmd, [out_file], on_progress, timeout, token)
+
+def convert_renditions(mp4_file, outputs, on_progress=None, timeout=None, token=None):
+    """单次解码写出全部规格，参数与返回值同 convert_file"""
+    cmd = build_rendition_cmd(mp4_file, [(_partial_path(f), r) for f, r in outputs])
+    return _run_conversion(cmd, [f for f, _ in outputs], on_progress, timeout, token)
+
+def _should_segment(info, options):
+    return (options.segment_min_duration > 0 and options.segment_count > 1 and info is not None
+            and info.duration is not None and info.duration >= options.segment_min_duration)
+
+def _convert_segmented(mp4_file, out_file, info, options, on_progress=None, timeout=None):
+    """
+    超长文件分段并行编码（各段编码进程之间互不依赖，拼接在帧级别完成）
+    :return: 同 convert_file；分段失败时返回 None，由调用方回退到整段编码
+    """
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    # 本任务已占用一个名额，其余分段与其他任务共用 --jobs / --io-readers / --io-writers 名额
+    slots = None
+    if options.limiter is not None:
+        slots = options.limiter.slots({mp4_file.stat().st_dev}, options.write_devices)
+    try:
+        count = encode_segmented(mp4_file, _partial_path(out_file), info.duration, info.sample_rate,
+                                 ENCODE_SETTINGS["bitrate"], options.segment_count,
+                                 options.segment_count, on_progress, timeout, options.cancel_token, slots)
+    except (SegmentError, OSError) as e:
+        _finish_outputs([out_file], False)
+        if options.cancelled:
+            return ffmpeg_runner.CANCELLED_RETURNCODE, "任务已取消", 0.0
+        logger.warning(f"分段编码失败，回退到整段编码 ({mp4_file.name}): {e}")
+        return None
+    except BaseException:
+        _finish_outputs([out_file], False)
+        raise
+    _finish_outputs([out_file], True)
+    logger.info(f"分段并行编码完成 ({mp4_file.name}): {count} 段")
+    return 0, "", info.duration
+
+def _convert_task(mp4_file, rel_path, dest_path, options, submitted_at=None, progress=None, info=None):
+    """
+    工作线程任务：先探测音频编码，能无损流复制时直接复制，否则重新编码；
+    转换成功后按需计算源文件哈希（供清单记录）。
+    - progress: 共享 dict，写入 {rel_path: 当前文件完成比例}，由主线程汇总刷新进度条
+    - info: 探测阶段已得到的 AudioInfo，为 None 时在此探测
+    """
+    started = time.perf_counter()
+    queue_wait = started - submitted_at if submitted_at else 0.0
+    if options.cancelled:
+        return ConversionResult(False, "任务已取消", returncode=ffmpeg_runner.CANCELLED_RETURNCODE,
+                                queue_wait=queue_wait)
+
+    # 探测结果同时用于选择转换方式和按媒体时间推进进度（ffprobe 不可用时为 None）
+    if info is None:
+        info = probe_file(mp4_file)
+    duration = info.duration if info is not None else None
+    if info is not None and not info.has_audio:
+        return ConversionResult(False, "未发现音频流", queue_wait=queue_wait,
+                                wall_time=time.perf_counter() - started, media_duration=duration)
 
-# --- 日志系统初始化 ---
-logger = LoggerManager.setup_logger(logger_name="mp4-to-mp3-extractor")
+    def on_progress(seconds):
+        if progress is not None and duration:
+            progress[rel_path] = min(seconds / duration, 1.0)
 
-def extract_audio(src_dir, dest_dir):
+    timeout = _timeout_for(duration, mp4_file.stat().st_size, options)
+
+    if options.renditions:
+        # 多规格：每个规格输出到各自的子目录，并保持原有目录结构
+        outputs = _outputs_for(rel_path, dest_path, options.renditions)
+        returncode, error, media_seconds = convert_renditions(mp4_file, outputs, on_progress, timeout,
+                                                              options.cancel_token)
+        ok = returncode == 0
+        digest = file_digest(mp4_file) if ok and options.with_hash else None
+        return ConversionResult(ok, error, "transcode", [f for f, _ in outputs], digest, returncode,
+                                queue_wait, time.perf_counter() - started, duration or media_seconds or None)
+
+    mode, suffix = choose_mode(info, options.stream_copy, options.copy_aac)
+    out_file = dest_path / rel_path.with_suffix(suffix)
+    if mode == "transcode" and _should_segment(info, options):
+        result = _convert_segmented(mp4_file, out_file, info, options, on_progress, timeout)
+        if result is not None:
+            returncode, error, media_seconds = result
+            ok = returncode == 0
+            digest = file_digest(mp4_file) if ok and options.with_hash else None
+            return ConversionResult(ok, error, mode, [out_file], digest, returncode,
+                                    queue_wait, time.perf_counter() - started, duration)
+    returncode, error, media_seconds = convert_file(mp4_file, out_file, mode, on_progress, timeout,
+                                                    options.cancel_token)
+
+    if returncode != 0 and mode == "copy" and not options.cancelled:
+        # 流复制失败（如封装不兼容）时回退到重新编码
+        logger.warning(f"流复制失败，回退到重新编码 ({mp4_file.name}): {error}")
+        mode = "transcode"
+        out_file = dest_path / rel_path.with_suffix(".mp3")
+        returncode, error, media_seconds = convert_file(mp4_file, out_file, mode, on_progress, timeout,
+                                                        options.cancel_token)
+
+    ok = returncode == 0
+    wall_time = time.perf_counter() - started
+    digest = file_digest(mp4_file) if ok and options.with_hash else None
+    return ConversionResult(ok, error, mode, [out_file], digest, returncode,
+                            queue_wait, wall_time, duration or media_seconds or None)
+
+def _convert_batch_task(items, dest_path, options, submitted_at=None, progress=None):
+    """
+    工作线程任务：把一批小文件合并到一个 FFmpeg 进程中转换，摊薄进程启动与编码器初始化开销。
+    批处理不再单独探测（探测阶段已完成，有缓存时不启动 ffprobe，没有音频流的文件不会进入批次），统一重新编码；
+    整批失败时逐个单独重试，保证错误能归属到具体文件。
+    :return: 与 items 一一对应的 ConversionResult 列表
+    """
+    started = time.perf_counter()
+    queue_wait = started - submitted_at if submitted_at else 0.0
+    inputs = [(mp4_file, _outputs_for(rel_path, dest_path, options.renditions))
+              for mp4_file, rel_path, _ in items]
+    partial_inputs = [(mp4_file, [(_partial_path(f), r) for f, r in outputs]) for mp4_file, outputs in inputs]
+    timeout = _timeout_for(None, sum(src_stat.st_size for _, _, src_stat in items), options)
+    returncode, error, _ = _run_conversion(build_batch_cmd(partial_inputs),
+                                           [f for _, outputs in inputs for f, _ in outputs], timeout=timeout,
+                                           token=options.cancel_token)
+
+    if returncode == 0:
+        # 整批耗时平均分摊到每个文件
+        wall_time = (time.perf_counter() - started) / len(items)
+        results = []
+        for mp4_file, outputs in inputs:
+            digest = file_digest(mp4_file) if options.with_hash else None
+            results.append(ConversionResult(True, "", "transcode", [f for f, _ in outputs], digest,
+                                            returncode, queue_wait, wall_time))
+        return results
+
+    if options.cancelled:
+        return [ConversionResult(False, error, returncode=returncode, queue_wait=queue_wait) for _ in items]
+    logger.warning(f"批处理失败（{len(items)} 个文件），逐个重试: {error.splitlines()[-1] if error else returncode}")
+    return [_convert_task(mp4_file, rel_path, dest_path, options, time.perf_counter(), progress)
+            for mp4_file, rel_path, _ in items]
+
+def _follower_outputs(primary_rel, primary_outputs, rel_path, dest_path):
+    """把代表文件的输出路径映射到同内容文件的位置（保留多规格子目录与输出后缀）"""
+    outputs = []
+    for out_file in primary_outputs:
+        rel_out = out_file.relative_to(dest_path)
+        prefix = rel_out.parts[:len(rel_out.parts) - len(primary_rel.parts)]
+        outputs.append(dest_path.joinpath(*prefix, rel_path.with_suffix(out_file.suffix)))
+    return outputs
+
+def _planned_outputs(rel_path, dest_path, options):
+    """任务可能写入的全部输出（相对输出根目录的 posix 路径，含流复制时的 .m4a），开始执行前记入任务表"""
+    out_files = [f for f, _ in _outputs_for(rel_path, dest_path, options.renditions)]
+    out_files.append(dest_path / rel_path.with_suffix(".m4a"))
+    return [f.relative_to(dest_path).as_posix() for f in out_files]
+
+def _cleanup_partials(rel_path, dest_path, options, outputs=None):
+    """
+    删除被中断任务留下的临时输出（含分段编码的工作目录）
+    - outputs: 任务表中记录的计划输出；早期记录没有时按当前参数推算
+    """
+    if outputs is None:
+        outputs = _planned_outputs(rel_path, dest_path, options)
+    for output in outputs:
+        partial = _partial_path(dest_path / output)
+        partial.unlink(missing_ok=True)
+        shutil.rmtree(partial.with_name(f".{partial.name}.segments"), ignore_errors=True)
+
+def _output_size(paths):
+    total = 0
+    for path in paths:
+        try:
+            total += path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+def _log_fields(rel_path, result):
+    """结构化日志字段（JSON 日志中作为独立字段输出）"""
+    return {"path": rel_path.as_posix(), "duration": round(result.wall_time, 3), "returncode": result.returncode}
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+class ExtractError(Exception):
+    """任务无法开始（如源目录不存在、参数冲突）"""
+
+def _check_options(jobs, renditions, dedup, order, shard, batch_max_bytes, batch_file_size, batch_max_files,
+                   segment_min_duration, segment_count, max_attempts, watch_settle, timeout_factor, timeout_min,
+                   io_readers, io_writers, lease_ttl):
+    """
+    在开始任务之前校验全部参数（嵌入调用时不经过 argparse），返回解析后的 (renditions, shard)
+    :raise ExtractError: 参数取值无效
+    """
+    if isinstance(renditions, str):
+        try:
+            renditions = parse_renditions(renditions)
+        except ValueError as e:
+            raise ExtractError(f"renditions 无效: {e}")
+    elif renditions and not all(isinstance(r, Rendition) for r in renditions):
+        raise ExtractError("renditions 须为规格字符串或 Rendition 列表")
+    if isinstance(shard, str):
+        try:
+            shard = parse_shard(shard)
+        except ValueError as e:
+            raise ExtractError(str(e))
+    if dedup is not None and dedup not in LINK_MODES:
+        raise ExtractError(f"dedup 无效: {dedup!r}（可选: {', '.join(LINK_MODES)}）")
+    if order not in ORDERS:
+        raise ExtractError(f"order 无效: {order!r}（可选: {', '.join(ORDERS)}）")
+    for name, value, minimum in (("jobs", jobs, 1), ("segment_count", segment_count, 1),
+                                 ("batch_max_files", batch_max_files, 1), ("max_attempts", max_attempts, 1),
+                                 ("batch_max_bytes", batch_max_bytes, 0), ("batch_file_size", batch_file_size, 0),
+                                 ("io_readers", io_readers, 0), ("io_writers", io_writers, 0)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < minimum):
+            raise ExtractError(f"{name} 须为不小于 {minimum} 的整数: {value!r}")
+    for name, value in (("segment_min_duration", segment_min_duration), ("watch_settle", watch_settle),
+                        ("timeout_factor", timeout_factor), ("timeout_min", timeout_min)):
+        if value is not None and (not isinstance(value, (int, float)) or value < 0):
+            raise ExtractError(f"{name} 须为非负数: {value!r}")
+    if not isinstance(lease_ttl, (int, float)) or lease_ttl <= 0:
+        raise ExtractError(f"lease_ttl 须为正数: {lease_ttl!r}")
+    return renditions, shard
+
+@dataclass
+class FileResult:
+    """单个文件的处理结果（iter_extract 逐个产出）"""
+    path: str                     # 相对源目录的路径（posix 风格）
+    source: Path
+    status: str                   # success / failed / skipped
+    mode: Optional[str] = None    # 成功时为 copy / transcode / linked
+    outputs: List[Path] = field(default_factory=list)
+    message: str = ""             # 失败原因或跳过原因
+    returncode: Optional[int] = None
+    wall_time: float = 0.0
+    media_duration: Optional[float] = None
+
+@dataclass
+class RunSummary:
+    """一次任务的汇总"""
+    found: int = 0
+    success: int = 0
+    failed: int = 0
+    skipped: int = 0              # 未变化（含断点续跑时上次已完成）而跳过的文件数
+    copied: int = 0
+    transcoded: int = 0
+    linked: int = 0
+    no_audio: int = 0             # 没有音频流而跳过的文件数（不计入 skipped）
+    exhausted: int = 0
+    remote: int = 0               # 多节点运行时由其他节点处理的文件数
+    cancelled: bool = False
+    metrics: dict = field(default_factory=dict)  # 耗时分位数等遥测汇总（见 MetricsRecorder.close）
+
+def iter_extract(src_dir, dest_dir, files=None, cancel_token=None, progress_bar=True,
+                 jobs=None, force=False, with_hash=False,
+                 stream_copy=True, copy_aac=False, metrics_file=None, prometheus_file=None,
+                 renditions=None, batch_max_bytes=0, batch_file_size=8 * 1024 * 1024, batch_max_files=32,
+                 segment_min_duration=0.0, segment_count=None, resume=False, max_attempts=3,
+                 watch=False, watch_settle=5.0, watch_poll=False, timeout_factor=1.0, timeout_min=120.0,
+                 dedup=None, io_readers=0, io_writers=0, order="duration",
+                 shard=None, lease=False, lease_ttl=120.0, worker_id=None):
+    """
+    提取音频的生成器：每处理完一个文件（含跳过）产出一个 FileResult，结束时返回 RunSummary（生成器返回值）
+    - files: 只处理给定的文件（须位于 src_dir 之下），为 None 时扫描整个 src_dir
+    - cancel_token: CancelToken，可在任意线程调用 cancel() 结束在途 FFmpeg 并尽快返回（summary.cancelled 为 True）
+    - progress_bar: 是否显示 tqdm 进度条
+    - shard: 哈希分片 (I, N) 或 "I/N"；lease: 是否通过租约文件与其他节点协调（见 sharding 模块）
+    其余参数与命令行选项一一对应
+    :raise ExtractError: 源目录不存在、参数取值无效或参数冲突
+    """
+    renditions, shard = _check_options(jobs, renditions, dedup, order, shard, batch_max_bytes, batch_file_size,
+                                       batch_max_files, segment_min_duration, segment_count, max_attempts,
+                                       watch_settle, timeout_factor, timeout_min, io_readers, io_writers, lease_ttl)
     src_path = Path(src_dir).resolve()
     dest_path = Path(dest_dir).resolve()
+    jobs = jobs or os.cpu_count() or 1
+    token = cancel_token or CancelToken()
+    # 按设备限制并发读写（目标目录下的输出都写入同一设备），同时限制 FFmpeg 进程总数（含分段编码的额外分段）
+    limiter = DeviceLimiter(io_readers, io_writers, jobs)
+    write_devices = frozenset({device_of(dest_path)})
+    options = ConvertOptions(with_hash=with_hash, stream_copy=stream_copy, copy_aac=copy_aac,
+                             renditions=renditions or None, batch_max_bytes=batch_max_bytes,
+                             batch_file_size=batch_file_size, batch_max_files=batch_max_files,
+                             segment_min_duration=segment_min_duration or 0.0,
+                             segment_count=segment_count or jobs,
+                             timeout_factor=timeout_factor, timeout_min=timeout_min, cancel_token=token,
+                             limiter=limiter, write_devices=write_devices)
+
+    # 日志系统与进度条依赖在真正开始转换时才初始化/导入，import 本模块不产生任何副作用
+    LoggerManager.setup_logger(logger_name=LOGGER_NAME)
+    ensure_package.pip("tqdm", "tqdm")
+    from tqdm import tqdm
 
     logger.info(f"--- 开始任务: 从 {src_path} 提取音频 ---")
 
     if not src_path.is_dir():
-        logger.error(f"源目录不存在: {src_path}")
-        sys.exit(1)
+        raise ExtractError(f"源目录不存在: {src_path}")
+    if watch and files is not None:
+        raise ExtractError("监听模式不能与文件列表同时使用")
+    # 多节点运行时，清单、任务表与探测索引按节点标识分别存放
+    state_tag = sharding.state_tag(shard, lease, worker_id)
+    settings = dict(ENCODE_SETTINGS, stream_copy=stream_copy, copy_aac=copy_aac,
+                    renditions=[r.name for r in options.renditions] if options.renditions else None)
+    # 租约模式：开始前登记本节点并加入当前轮次（节点标识已被其他存活进程使用时不开始任务）；
+    # 没有存活登记的节点已经退出，其清单、探测索引与任务表并入本节点后删除，状态文件不会随运行次数增长
+    leases, retire = None, None
+    if lease:
+        try:
+            leases = LeaseManager(dest_path, state_tag, lease_ttl, settings).start()
+        except LeaseError as e:
+            raise ExtractError(str(e))
+        retire = lambda tag: not leases.is_live(tag)
 
-    mp4_files = list(src_path.rglob("*.mp4"))
-    if not mp4_files:
-        logger.warning("扫描完成：未发现任何 .mp4 文件。")
-        sys.exit(0)
+    # 1. 流式扫描：后台线程边扫描边把文件送入有界队列，转换无需等待整棵目录树遍历完成
+    on_scan_error = lambda path, e: logger.warning(f"读取失败，已跳过 ({path}): {e}")
+    if watch:
+        # 监听模式：扫描完已有文件后继续常驻，新文件写入稳定后送入同一条转换流程
+        discovery = WatchWorker(src_path, settle=watch_settle, force_poll=watch_poll,
+                                on_error=on_scan_error, on_notice=logger.warning).start()
+    elif files is not None:
+        discovery = FileListWorker(src_path, files, on_error=on_scan_error).start()
+    else:
+        discovery = DiscoveryWorker(src_path, on_error=on_scan_error).start()
+    logger.info(f"开始扫描并转换。目标路径: {dest_path}，并发数: {jobs}")
+    if watch:
+        logger.info(f"监听模式：文件 {watch_settle:g} 秒内无变化视为写入完成，按 Ctrl+C 停止")
+    if options.renditions:
+        logger.info(f"多规格输出（单次解码）: {', '.join(r.name for r in options.renditions)}")
+    if options.batch_max_bytes:
+        logger.info(f"小文件批处理: 不超过 {options.batch_file_size} 字节的文件合并转换，"
+                    f"每批至多 {options.batch_max_files} 个 / {options.batch_max_bytes} 字节")
+    if limiter.enabled:
+        logger.info(f"I/O 调度: 每个源设备至多 {io_readers or '不限'} 个并发读取，"
+                    f"目标设备至多 {io_writers or '不限'} 个并发写入")
+    if order != "duration":
+        logger.info(f"调度顺序: {order}")
+    if shard:
+        logger.info(f"哈希分片: 本节点处理第 {shard[0]}/{shard[1]} 片（节点标识 {state_tag}）")
+    if lease:
+        logger.info(f"租约认领: 节点标识 {state_tag}，轮次 {leases.run_id[:8]}，租约 {lease_ttl:g} 秒未刷新视为过期")
+    if dedup:
+        logger.info(f"内容去重: 内容相同的源文件只转换一次，其余输出以 {dedup} 方式生成")
+    if options.segment_min_duration and not options.renditions:
+        logger.info(f"超长文件分段并行: 时长 ≥ {options.segment_min_duration:g} 秒的文件切为 {options.segment_count} 段并行编码")
+
+    manifest = ConversionManifest.load(dest_path, tag=state_tag, retire=retire)
+    recorder = MetricsRecorder(metrics_file, prometheus_file)
+    probe_index = ProbeIndex.load(dest_path, tag=state_tag, retire=retire)
+    # 探测阶段：与转换线程池分开，探测结果回到主线程后再进入调度（ffprobe 不可用时跳过）
+    prober = ThreadPoolExecutor(max_workers=jobs) if ffprobe_available() else None
+    probing = {}                  # 探测 future -> (mp4_file, rel_path, src_stat)
+    probe_wait = collections.deque()  # 等待源设备读取名额的探测
+    infos = {}                    # 待转换文件 rel_path -> AudioInfo
 
-    logger.info(f"扫描完成，发现 {len(mp4_files)} 个视频文件。目标路径: {dest_path}")
+    # 持久化任务表：--resume 时沿用上次的任务状态，否则从头记录
+    # 上次被强制结束（如 SIGKILL）的任务：无论是否 --resume 都清理其临时输出，避免隐藏的半成品永久残留；
+    # 租约模式下还包括已退出节点中断的任务
+    queue = JobQueue.open(dest_path, resume=resume, tag=state_tag)
+    interrupted = list(queue.interrupted)
+    if retire is not None:
+        retired = JobQueue.retire(dest_path, retire)
+        if retired:
+            logger.info(f"租约认领: 已删除 {len(retired)} 个已退出节点的任务表（{', '.join(sorted(retired))}），其清单与探测索引已并入本节点")
+        for jobs_of_node in retired.values():
+            interrupted.extend(jobs_of_node)
+    for rel_path, outputs in interrupted:
+        # 租约模式下这些文件可能已被存活的其他节点接管、正在写入同名临时文件，此时不能删除
+        if leases is None or not leases.active(rel_path):
+            _cleanup_partials(rel_path, dest_path, options, outputs)
+    if resume:
+        logger.info(f"断点续跑：上次任务状态 {queue.counts()}，其中 {len(queue.interrupted)} 个中断任务已重新排队")
 
     success = 0
     fail = 0
+    skipped = 0
+    resumed = 0                   # skipped 中断点续跑时上次已完成的文件数
+    exhausted = 0
+    no_audio = 0
+    copied = 0
+    transcoded = 0
+    linked = 0
+    foreign = 0                   # 哈希分片时属于其他分片的文件数
+    remote = 0
+    emitted = collections.deque() # 待产出的 FileResult（各处理函数写入，主循环中逐个 yield）
 
-    # 2. 使用 tqdm 包装循环
-    # unit="file" 定义单位，desc 定义前缀
-    pbar = tqdm(mp4_files, desc="处理进度", unit="file", ncols=100)
+    def emit(item, status, message="", result=None):
+        mp4_file, rel_path, _ = item
+        if result is None:
+            emitted.append(FileResult(rel_path.as_posix(), mp4_file, status, message=message))
+        else:
+            emitted.append(FileResult(rel_path.as_posix(), mp4_file, status, result.mode if result.ok else None,
+                                      result.out_files if result.ok else [], result.error,
+                                      result.returncode, result.wall_time, result.media_duration))
 
-    for mp4_file in pbar:
-        rel_path = mp4_file.relative_to(src_path)
-        out_file = dest_path / rel_path.with_suffix(".mp3")
-        
-        # 3. 更新进度条左侧的动态描述（可选，显示当前文件名）
-        pbar.set_postfix_str(f"正在处理: {mp4_file.name[:20]}...")
-        
+    # 内容去重：重复内容的文件挂在代表文件下，代表文件转换成功后再生成它们的输出
+    # 需要读取文件的哈希计算交给独立的哈希线程，结果回到主线程后再判断是否重复
+    index = ContentIndex() if dedup else None
+    hasher = ThreadPoolExecutor(max_workers=jobs) if dedup else None
+    hashing = {}                  # 哈希 future -> ((mp4_file, rel_path, src_stat), 就绪后的处理函数)
+    followers = {}                # 代表文件 rel_path -> [(mp4_file, rel_path, src_stat), ...]
+    primary_outputs = {}          # 已成功的代表文件 rel_path -> 输出文件列表
+
+    # 2. 长任务优先调度：在已发现但未提交的窗口内按媒体时长从长到短提交，避免超长文件拖尾
+    # （--order size / path / inode 时改为按文件大小 / 目录 / inode 顺序，见 io_scheduler.order_key）
+    # 每个任务是一组 (mp4_file, rel_path, src_stat)：普通文件一组一个，小文件批处理时一组多个
+    pending = []                  # 堆：(排序键, 序号, 任务)
+    window = max(jobs * 4, 64)    # 待调度窗口上限，限制内存占用
+    seq = 0
+    batch = []                    # 正在凑批的小文件
+    batch_bytes = 0
+    batches = 0
+
+    def enqueue(items):
+        nonlocal seq
+        duration = sum(media.get(item[1], 0.0) for item in items)
+        heapq.heappush(pending, (order_key(order, items, duration), seq, items))
+        seq += 1
+
+    def flush_batch():
+        nonlocal batch, batch_bytes, batches
+        if batch:
+            enqueue(batch)
+            batches += len(batch) > 1
+            batch, batch_bytes = [], 0
+
+    # 3. 使用 tqdm 显示进度（总数随扫描实时增长，扫描结束后标记为最终值）
+    # unit="file" 定义单位，desc 定义前缀；在途文件按媒体时间折算为小数进度
+    # 剩余时间由 refresh_progress 按媒体秒数估算并写入 postfix，不使用 tqdm 按文件数推算的剩余时间
+    pbar = tqdm(total=0, desc="处理进度(监听中)" if watch else "处理进度(扫描中)", unit="file", ncols=100,
+                disable=not progress_bar, bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}, {rate_fmt}{postfix}]")
+    completed = 0
+    progress = {}                 # 在途文件的完成比例（工作线程写，主线程读）
+    # 剩余时间按媒体秒数估算：media 为未完成文件的媒体时长（未探测时按大小估算），media_done 为已完成的媒体秒数
+    media = {}
+    media_done = 0.0
+    first_submit = None
+    last_done = ""
+
+    def refresh_progress():
+        in_flight = {rel_path: ratio for rel_path, ratio in list(progress.items())}
+        pbar.n = round(completed + sum(in_flight.values()), 2)
+        processed = media_done + sum(ratio * media.get(rel_path, 0.0) for rel_path, ratio in in_flight.items())
+        postfix = f"✅ {last_done[:25]}" if last_done else ""
+        if first_submit is not None and processed > 0:
+            rate = processed / (time.perf_counter() - first_submit)
+            remaining = (sum(media.values()) - processed + media_done) / rate
+            postfix = f"剩余≈{_format_seconds(remaining)} {postfix}".rstrip()
+        pbar.set_postfix_str(postfix, refresh=False)
+        pbar.refresh()
+
+    def resume_skip(mp4_file, rel_path, src_stat):
+        """断点续跑时判断是否沿用上次的结果：已完成且输出完整，或失败次数已达上限"""
+        nonlocal skipped, resumed, exhausted
+        job = queue.lookup(rel_path, src_stat)
+        if job is None:
+            return False
+        state, attempts, outputs = job
+        if state == DONE and outputs:
+            out_files = [dest_path / output for output in outputs]
+            if all(f.is_file() for f in out_files):
+                # 清单按间隔落盘，上次中断时可能尚未写入
+                if not manifest.is_current(rel_path, src_stat, dest_path, settings):
+                    manifest.record(rel_path, src_stat, dest_path, out_files, settings)
+                skipped += 1
+                resumed += 1
+                emit((mp4_file, rel_path, src_stat), "skipped", "上次任务已完成")
+                return True
+        if state == FAILED and attempts >= max_attempts:
+            exhausted += 1
+            emit((mp4_file, rel_path, src_stat), "skipped", f"已失败 {attempts} 次，不再重试")
+            return True
+        return False
+
+    def schedule(item):
+        nonlocal batch_bytes
+        if options.batch_max_bytes and item[2].st_size <= options.batch_file_size:
+            batch.append(item)
+            batch_bytes += item[2].st_size
+            if len(batch) >= options.batch_max_files or batch_bytes >= options.batch_max_bytes:
+                flush_batch()
+        else:
+            enqueue([item])
+
+    def link_follower(item, primary):
+        """以代表文件的输出生成同内容文件的输出（任何错误只记为该文件失败，不影响代表文件与其他同内容文件）"""
+        nonlocal completed
+        mp4_file, rel_path, src_stat = item
+        started = time.perf_counter()
         try:
-            out_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # ✅ 修复后的正确命令（已测试可直接用）
-            cmd = [
-                "ffmpeg", "-y", "-i", str(mp4_file),
-                "-vn",                    # 去除视频流
-                "-c:a", "libmp3lame",     # 使用 MP3 编码器
-                "-b:a", "192k",           # 192kbps 音质（可改成 128k / 256k）
-                str(out_file),
-                "-loglevel", "error"
-            ]
-            
-            # 使用 capture_output 避免 ffmpeg 日志刷屏
-            process = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            
-            if process.returncode == 0:
-                success += 1
-                # 可选：进度条显示成功
-                pbar.set_postfix_str(f"✅ {mp4_file.name[:25]}")
-            else:
-                tqdm.write(f" [错误] FFmpeg 报错 ({mp4_file.name}): {process.stderr.strip()}")
-                logger.error(f"FFmpeg 报错 ({mp4_file.name}): {process.stderr.strip()}")
-                fail += 1
-                
+            out_files = _follower_outputs(primary, primary_outputs[primary], rel_path, dest_path)
+            for src, dst in zip(primary_outputs[primary], out_files):
+                materialize(src, dst, _partial_path(dst), dedup)
+            result = ConversionResult(True, mode="linked", out_files=out_files,
+                                      wall_time=time.perf_counter() - started)
         except Exception as e:
-            tqdm.write(f" [严重错误] {mp4_file.name}: {str(e)}")
-            logger.error(f"系统错误 ({mp4_file.name}): {str(e)}")
+            result = ConversionResult(False, f"去重链接失败: {e}", wall_time=time.perf_counter() - started)
+        handle_result(item, result)
+        completed += 1
+
+    def when_hashed(item, then):
+        """去重所需的哈希就绪后在主线程中执行 then(item)；需要读取文件时先交给哈希线程"""
+        mp4_file, _, src_stat = item
+        if index.ready(mp4_file, src_stat.st_size):
+            then(item)
+        else:
+            hashing[hasher.submit(index.prepare, mp4_file, src_stat.st_size)] = (item, then)
+
+    def dedup_route(item):
+        """内容与已登记文件相同时挂起或直接链接；新内容照常进入探测与转换"""
+        mp4_file, rel_path, src_stat = item
+        primary = index.match(rel_path, mp4_file, src_stat.st_size)
+        if primary is None:
+            admit(item)
+        elif primary in primary_outputs:
+            link_follower(item, primary)
+        else:
+            followers.setdefault(primary, []).append(item)
+
+    def register_existing(item):
+        """已有输出（未变化跳过）的文件同样登记为代表文件，新出现的副本可直接链接"""
+        mp4_file, rel_path, src_stat = item
+        if index.match(rel_path, mp4_file, src_stat.st_size) is None:
+            primary_outputs[rel_path] = manifest.outputs(rel_path, dest_path)
+
+    def resolve_followers(rel_path, ok, out_files):
+        """代表文件完成后处理挂起的同内容文件：成功则链接，失败则各自照常转换"""
+        waiting = followers.pop(rel_path, [])
+        if ok:
+            primary_outputs[rel_path] = out_files
+            for item in waiting:
+                link_follower(item, rel_path)
+        else:
+            index.discard(rel_path)
+            for item in waiting:
+                admit(item)
+
+    def admit(item):
+        """待转换文件进入探测阶段：命中缓存时直接调度，否则等待源设备的读取名额后提交给探测线程"""
+        mp4_file, rel_path, src_stat = item
+        media[rel_path] = estimate_duration(src_stat.st_size)
+        # 参与批处理的小文件同样先经过探测索引，没有音频流的文件不会进入批次；重跑时全部命中缓存
+        info = probe_index.get(rel_path, src_stat)
+        if info is not None or prober is None:
+            route(item, info)
+        else:
+            probe_wait.append(item)
+            submit_probes()
+
+    def submit_probes():
+        """探测同样读取源设备，与转换共用 --io-readers 名额（不占用 --jobs 名额）"""
+        for _ in range(len(probe_wait)):
+            item = probe_wait.popleft()
+            if limiter.try_acquire({item[2].st_dev}, (), job=False):
+                probing[prober.submit(probe_file, item[0])] = item
+            else:
+                probe_wait.append(item)
+
+    def route(item, info):
+        """按探测结果调度：没有音频流的文件直接跳过，其余记录媒体时长后进入调度窗口"""
+        nonlocal no_audio, completed
+        mp4_file, rel_path, src_stat = item
+        if info is not None and not info.has_audio:
+            media.pop(rel_path, None)
+            no_audio += 1
+            completed += 1
+            recorder.count_skipped()
+            logger.warning(f"未发现音频流，已跳过: {rel_path.as_posix()}", extra={"path": rel_path.as_posix()})
+            emit(item, "skipped", "未发现音频流")
+            if leases is not None:
+                leases.complete(rel_path, src_stat, False)
+            if index is not None:
+                resolve_followers(rel_path, False, [])
+            return
+        if info is not None:
+            infos[rel_path] = info
+            if info.duration:
+                media[rel_path] = info.duration
+        schedule(item)
+
+    # 租约认领：新发现的文件先放入 unclaimed，本节点持有的租约少于 claim_ahead 时才逐个认领，
+    # 避免一个节点一次认领整个扫描窗口；被其他节点持有的文件暂存于 contested，定期复查，直到对方完成或租约过期后由本节点接管
+    unclaimed = collections.deque()
+    claim_ahead = jobs * 2
+    contested = []
+    lease_recheck = max(0.5, min(2.0, lease_ttl / 4))
+    next_recheck = 0.0
+
+    def claim(item):
+        """认领成功返回 True；其他节点已完成的记为由其他节点处理，正在处理的放入 contested"""
+        nonlocal remote, completed
+        state = leases.claim(item[1], item[2])
+        if state == sharding.CLAIMED:
+            return True
+        if state == sharding.DONE:
+            remote += 1
+            completed += 1
+            emit(item, "skipped", "已由其他节点处理")
+        else:
+            contested.append(item)
+        return False
+
+    def accept(item):
+        """确定由本节点处理的文件：登记任务表后进入去重与探测阶段"""
+        queue.add(item[1], item[2])
+        if index is not None:
+            when_hashed(item, dedup_route)
+        else:
+            admit(item)
+
+    def handle_result(task, result):
+        nonlocal success, fail, copied, transcoded, linked, media_done, last_done
+        mp4_file, rel_path, src_stat = task
+        if leases is not None:
+            leases.complete(rel_path, src_stat, result.ok)
+        media_done += media.pop(rel_path, 0.0)
+        infos.pop(rel_path, None)
+        recorder.add(FileMetrics(
+            path=rel_path.as_posix(),
+            status="success" if result.ok else "failed",
+            mode=result.mode if result.ok else None,
+            queue_wait=round(result.queue_wait, 4),
+            wall_time=round(result.wall_time, 4),
+            input_bytes=src_stat.st_size,
+            output_bytes=_output_size(result.out_files) if result.ok else 0,
+            media_duration=result.media_duration,
+            returncode=result.returncode,
+        ))
+        if result.ok:
+            success += 1
+            if result.mode == "copy":
+                copied += 1
+            elif result.mode == "linked":
+                linked += 1
+            else:
+                transcoded += 1
+            manifest.record(rel_path, src_stat, dest_path, result.out_files, settings, result.digest)
+            queue.mark_done(rel_path, [f.relative_to(dest_path).as_posix() for f in result.out_files])
+            # 可选：进度条显示成功
+            last_done = mp4_file.name
+            # 逐文件明细只写日志文件；监听模式下同时输出到控制台
+            logger.info(f"已转换: {rel_path.as_posix()}（{result.wall_time:.1f}s）",
+                        extra=dict(_log_fields(rel_path, result), file_only=not watch))
+        else:
+            tqdm.write(f" [错误] FFmpeg 报错 ({mp4_file.name}): {result.error}")
+            logger.error(f"FFmpeg 报错 ({mp4_file.name}): {result.error}", extra=_log_fields(rel_path, result))
+            manifest.forget(rel_path)
+            queue.mark_failed(rel_path, result.error)
             fail += 1
+        emit(task, "success" if result.ok else "failed", result=result)
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        futures = {}
+        task_devices = {}         # 在途任务 -> 读取的源设备
+        while True:
+            # 产出上一轮处理完的文件结果；调用方取消后不再提交新任务
+            while emitted:
+                yield emitted.popleft()
+            if token.cancelled:
+                break
+
+            # 3.1 收集新发现的文件；没有待办和在途任务时阻塞等待扫描线程
+            idle = not pending and not futures and not probing and not probe_wait and not hashing and not unclaimed
+            room = window - len(pending) - len(probing) - len(probe_wait) - len(hashing) - len(unclaimed)
+            if not discovery.done and room > 0:
+                new_items = discovery.drain(block=idle, timeout=0.5, limit=room)
+                for mp4_file, src_stat in new_items:
+                    rel_path = mp4_file.relative_to(src_path)
+                    if shard and not in_shard(rel_path, shard):
+                        foreign += 1
+                        continue
+                    # 增量判断：源文件与编码参数均未变化、且输出完整时跳过（--force 强制重新转换）
+                    if not force and manifest.is_current(rel_path, src_stat, dest_path, settings,
+                                                         src_file=mp4_file if with_hash else None):
+                        skipped += 1
+                        completed += 1
+                        recorder.count_skipped()
+                        emit((mp4_file, rel_path, src_stat), "skipped", "未变化")
+                        if index is not None:
+                            when_hashed((mp4_file, rel_path, src_stat), register_existing)
+                        continue
+                    if resume and resume_skip(mp4_file, rel_path, src_stat):
+                        completed += 1
+                        recorder.count_skipped()
+                        continue
+                    item = (mp4_file, rel_path, src_stat)
+                    if leases is not None:
+                        unclaimed.append(item)
+                        continue
+                    accept(item)
+                if new_items:
+                    pbar.total = discovery.found - foreign
+                if discovery.done:
+                    pbar.set_description(f"处理进度(共 {discovery.found - foreign})")
+
+            # 租约模式：复查被其他节点持有的文件，并只认领即将执行的少量文件
+            if contested and time.monotonic() >= next_recheck:
+                next_recheck = time.monotonic() + lease_recheck
+                unclaimed.extend(contested)
+                contested.clear()
+            while unclaimed and leases.held < claim_ahead:
+                item = unclaimed.popleft()
+                if claim(item):
+                    accept(item)
+
+            # 收集已完成的去重哈希，在主线程中判断是否重复
+            for future in [f for f in hashing if f.done()]:
+                item, then = hashing.pop(future)
+                future.result()
+                when_hashed(item, then)
+
+            # 收集已完成的探测结果，写入索引后进入调度窗口
+            for future in [f for f in probing if f.done()]:
+                item = probing.pop(future)
+                limiter.release({item[2].st_dev}, (), job=False)
+                info = future.result()
+                probe_index.put(item[1], item[2], info)
+                route(item, info)
+            submit_probes()
+
+            # 扫描结束，或工作线程空闲且没有其他待办时，提交未凑满的批次
+            if batch and (discovery.done or (not pending and len(futures) < jobs)):
+                flush_batch()
+
+            # 3.2 在工作线程空闲时，从窗口中按顺序取出任务提交；源设备或目标设备已满的任务暂缓
+            # （分段编码的额外分段也占用名额，名额用尽时即使有空闲线程也不再提交）
+            deferred = []
+            while pending and len(futures) < jobs and not limiter.full:
+                entry = heapq.heappop(pending)
+                items = entry[2]
+                read_devices = {item[2].st_dev for item in items}
+                if not limiter.try_acquire(read_devices, write_devices):
+                    deferred.append(entry)
+                    continue
+                for _, rel_path, _ in items:
+                    queue.mark_running(rel_path, _planned_outputs(rel_path, dest_path, options))
+                if first_submit is None:
+                    first_submit = time.perf_counter()
+                if len(items) == 1:
+                    mp4_file, rel_path, _ = items[0]
+                    future = pool.submit(_convert_task, mp4_file, rel_path, dest_path, options,
+                                         time.perf_counter(), progress, infos.get(rel_path))
+                else:
+                    future = pool.submit(_convert_batch_task, items, dest_path, options,
+                                         time.perf_counter(), progress)
+                futures[future] = items
+                task_devices[future] = read_devices
+            for entry in deferred:
+                heapq.heappush(pending, entry)
+
+            refresh_progress()
+            if not futures and not probing and not probe_wait and not hashing:
+                if discovery.done and not pending and not batch and not unclaimed:
+                    if not contested:
+                        break
+                    token.wait(lease_recheck)   # 其余文件都由其他节点持有：等待其完成或租约过期
+                continue
+
+            # 3.3 等待任意一个任务或探测完成（定期醒来收集新文件并按媒体时间刷新进度）
+            done, _ = wait([*futures, *probing, *hashing], timeout=0.2 if not discovery.done else 0.5,
+                           return_when=FIRST_COMPLETED)
+            if token.cancelled:
+                break             # 已取消任务的失败结果不计入任务表，下次运行时重新排队
+            for future in done:
+                if future not in futures:
+                    continue      # 探测与哈希结果在下一轮中处理
+                items = futures.pop(future)
+                limiter.release(task_devices.pop(future), write_devices)
+                try:
+                    results = future.result()
+                    if len(items) == 1:
+                        results = [results]
+                except Exception as e:
+                    results = [ConversionResult(False, str(e)) for _ in items]
+                    for mp4_file, rel_path, src_stat in items:
+                        tqdm.write(f" [严重错误] {mp4_file.name}: {str(e)}")
+                        logger.error(f"系统错误 ({mp4_file.name}): {str(e)}", extra={"path": rel_path.as_posix()})
+                        manifest.forget(rel_path)
+                        queue.mark_failed(rel_path, str(e))
+                        media.pop(rel_path, None)
+                        fail += 1
+                        emit((mp4_file, rel_path, src_stat), "failed", str(e))
+                        if leases is not None:
+                            leases.complete(rel_path, src_stat, False)
+                else:
+                    for item, result in zip(items, results):
+                        handle_result(item, result)
+                # 代表文件的结果记录之后再处理同内容文件，链接出错只影响对应的同内容文件
+                if index is not None:
+                    for item, result in zip(items, results):
+                        resolve_followers(item[1], result.ok, result.out_files)
+                for _, rel_path, _ in items:
+                    progress.pop(rel_path, None)
+                completed += len(items)
+    except GeneratorExit:
+        # 调用方提前结束迭代（break / close()）：结束本任务的 FFmpeg 进程后退出
+        token.cancel()
+        raise
+    except KeyboardInterrupt:
+        # 立即结束本任务的全部 FFmpeg 子进程：工作线程随之返回失败，临时输出由 _run_conversion 删除，
+        # 任务表中仍为 running 的文件会在下次启动时重新排队
+        token.cancel()
+        if not watch:
+            tqdm.write(" [中断] 收到停止信号，已结束全部 FFmpeg 进程")
+            raise
+        # 监听模式以 Ctrl+C 作为正常的停止方式，照常输出汇总
+        tqdm.write(" [监听] 收到停止信号，正在退出...")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if prober is not None:
+            prober.shutdown(wait=True, cancel_futures=True)
+        if hasher is not None:
+            hasher.shutdown(wait=True, cancel_futures=True)
+        discovery.stop()
+        if leases is not None:
+            leases.close()
+        refresh_progress()
+        pbar.close() # 显式关闭
+        manifest.save()
+        probe_index.save()
+        queue.close()
+        metrics = recorder.close()
+
+    while emitted:
+        yield emitted.popleft()
+    summary = RunSummary(discovery.found - foreign, success, fail, skipped, copied, transcoded, linked,
+                         no_audio, exhausted, remote, token.cancelled, metrics)
+    if token.cancelled and not watch:    # 监听模式以取消作为正常的停止方式
+        logger.warning("任务已取消：已结束全部 FFmpeg 进程，未完成的文件下次运行时重新排队。")
+    if discovery.found == 0:
+        logger.warning("扫描完成：未发现任何 .mp4 文件。")
+        return summary
+    if shard:
+        logger.info(f"哈希分片：共发现 {discovery.found} 个文件，其中 {discovery.found - foreign} 个属于本分片。")
+    if remote:
+        logger.info(f"多节点：{remote} 个文件已由其他节点处理。")
+
+    if skipped - resumed:
+        logger.info(f"增量模式：{skipped - resumed} 个文件未变化已跳过。")
+    if resumed:
+        logger.info(f"断点续跑：{resumed} 个文件上次任务已完成，已跳过。")
+    if no_audio:
+        logger.info(f"探测索引：{no_audio} 个文件没有音频流，已跳过。")
+    if probe_index.probed or probe_index.hits:
+        logger.info(f"探测索引：本次探测 {probe_index.probed} 个文件，缓存命中 {probe_index.hits} 个。")
+    if exhausted:
+        logger.warning(f"断点续跑：{exhausted} 个文件已失败 {max_attempts} 次，不再重试（可去掉 --resume 重新开始）。")
+    if batches:
+        logger.info(f"小文件批处理：共提交 {batches} 个批次。")
+    if index is not None and index.duplicates:
+        logger.info(f"内容去重：发现 {index.duplicates} 个重复文件，其中 {linked} 个本次以 {dedup} 方式生成输出。")
+    logger.info(f"扫描完成，共发现 {discovery.found} 个视频文件。")
+    if metrics["wall_p50"] is not None:
+        logger.info(f"单文件耗时: p50 {metrics['wall_p50']:.2f}s | p95 {metrics['wall_p95']:.2f}s | "
+                    f"p99 {metrics['wall_p99']:.2f}s | 媒体时长合计 {metrics['media_seconds']:.0f}s")
+        slowest = ", ".join(f"{item['path']} ({item['wall_time']:.1f}s)" for item in metrics["slowest"])
+        logger.info(f"最慢的文件: {slowest}")
+    linked_note = f", 去重链接 {linked}" if linked else ""
+    no_audio_note = f", 无音频 {no_audio}" if no_audio else ""
+    logger.info(f"--- 任务结束: 成功 {success}（流复制 {copied}, 重新编码 {transcoded}{linked_note}）, 失败 {fail}, "
+                f"跳过 {skipped}{no_audio_note} ---")
+    return summary
+
+class Extractor:
+    """
+    可嵌入的提取任务：在已有的 Python 进程中直接调用，无需为每次任务启动解释器
+    用法:
+        extractor = Extractor("/data/videos", "/data/audio", jobs=4, progress_bar=False)
+        for result in extractor:            # 每处理完一个文件产出一个 FileResult
+            print(result.path, result.status)
+        extractor.summary                   # 迭代结束后的 RunSummary
+        extractor.cancel()                  # 可在其他线程中调用
+    参数同 iter_extract；无法开始时在首次迭代时抛出 ExtractError
+    """
+
+    def __init__(self, src_dir, dest_dir, files=None, **kwargs):
+        self.src_dir = src_dir
+        self.dest_dir = dest_dir
+        self.files = files
+        self.kwargs = kwargs
+        self.cancel_token = CancelToken()
+        self.summary = None
+
+    def __iter__(self):
+        self.summary = yield from iter_extract(self.src_dir, self.dest_dir, self.files,
+                                               self.cancel_token, **self.kwargs)
+
+    def run(self):
+        """执行到结束（不关心逐个结果时使用），返回 RunSummary"""
+        for _ in self:
+            pass
+        return self.summary
 
-    pbar.close() # 显式关闭
-    
-    logger.info(f"--- 任务结束: 成功 {success}, 失败 {fail} ---")
-    print(f"\n[结果反馈] 成功: {success} | 失败: {fail}")
+    def cancel(self):
+        self.cancel_token.cancel()
+
+def extract_audio(src_dir, dest_dir, **kwargs):
+    """
+    命令行入口：执行完整任务并打印结果反馈，参数同 iter_extract
+    Ctrl+C 之外，SIGTERM（如 systemd / kill）也按中断处理，保证子进程被结束、临时输出被清理
+    :return: RunSummary
+    """
+    previous_sigterm = None
+    if threading.current_thread() is threading.main_thread():
+        previous_sigterm = signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        summary = Extractor(src_dir, dest_dir, **kwargs).run()
+    except KeyboardInterrupt:
+        # 本任务的进程已由其 CancelToken 结束；信号可能落在任务之外（如启动阶段），兜底结束本进程内的全部 FFmpeg
+        ffmpeg_runner.cancel_all()
+        raise
+    finally:
+        if previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, previous_sigterm)
+    if summary.found == 0:
+        return summary
+    linked_note = f" | 去重链接: {summary.linked}" if summary.linked else ""
+    LoggerManager.flush()         # 日志由后台线程输出，先等待其写完，保证结果反馈位于最后
+    print(f"\n[结果反馈] 成功: {summary.success}（流复制: {summary.copied} | 重新编码: {summary.transcoded}{linked_note}）"
+          f" | 失败: {summary.failed} | 跳过: {summary.skipped}"
+          + (f" | 无音频: {summary.no_audio}" if summary.no_audio else ""))
+    return summary
+
+def _shard_arg(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _size_arg(value):
+    """解析带单位的大小，如 512K / 64M / 1G"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的大小: {value}（示例: 64M）")
+
+def _renditions_arg(value):
+    try:
+        return parse_renditions(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量将 .mp4 视频提取为 .mp3 音频（保持目录结构）")
+    parser.add_argument("src_dir", help="源目录")
+    parser.add_argument("dest_dir", help="目标目录")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="并发转换的 FFmpeg 进程数（默认: CPU 核心数）")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略转换清单，强制重新转换所有文件")
+    parser.add_argument("--hash", dest="with_hash", action="store_true",
+                        help="在清单中记录源文件内容哈希（修改时间变化但内容未变时仍可跳过）")
+    parser.add_argument("--no-stream-copy", dest="stream_copy", action="store_false",
+                        help="关闭流复制，所有文件统一重新编码为 MP3")
+    parser.add_argument("--copy-aac", action="store_true",
+                        help="AAC 音频直接流复制为 .m4a（不重新编码）")
+    parser.add_argument("--renditions", type=_renditions_arg, default=None,
+                        help="多规格输出，如 \"64k,192k,opus:96k\"：每个源文件只解码一次，"
+                             "各规格分别输出到目标目录下的 mp3_64k/、opus_96k/ 等子目录")
+    parser.add_argument("--batch-max-bytes", type=_size_arg, default=0,
+                        help="开启小文件批处理：多个小文件合并到一个 FFmpeg 进程，单批输入总大小上限（如 64M，默认 0 关闭）")
+    parser.add_argument("--batch-file-size", type=_size_arg, default=8 * 1024 * 1024,
+                        help="参与批处理的单文件大小上限（默认 8M）")
+    parser.add_argument("--batch-max-files", type=int, default=32,
+                        help="单批文件数上限（默认 32）")
+    parser.add_argument("--segment-min-duration", type=float, default=0.0,
+                        help="时长不少于该秒数且需要重新编码的文件分段并行编码后无缝拼接（如 1800，默认 0 关闭）")
+    parser.add_argument("--segment-count", type=int, default=None,
+                        help="分段并行编码的段数（默认等于 --jobs）")
+    parser.add_argument("--resume", action="store_true",
+                        help="从上次中断处继续：沿用输出目录下的任务表，已完成的文件跳过，失败的文件重试")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="--resume 时单个文件的最大尝试次数，超过后不再重试（默认 3）")
+    parser.add_argument("--watch", action="store_true",
+                        help="热文件夹模式：处理完已有文件后常驻监听源目录，新文件写入完成后立即转换（Ctrl+C 停止）")
+    parser.add_argument("--watch-settle", type=float, default=5.0,
+                        help="监听模式下文件大小与修改时间保持不变多少秒才视为写入完成（默认 5）")
+    parser.add_argument("--watch-poll", action="store_true",
+                        help="监听模式下强制使用定时扫描（NFS/SMB 等网络共享上由其他机器写入时需要）")
+    parser.add_argument("--timeout-factor", type=float, default=1.0,
+                        help="单个 FFmpeg 进程的超时 = --timeout-min + 媒体时长 × 该系数（默认 1.0，0 表示不限制）")
+    parser.add_argument("--timeout-min", type=float, default=120.0,
+                        help="超时的固定部分（秒，默认 120）")
+    parser.add_argument("--dedup", choices=LINK_MODES, default=None,
+                        help="内容去重：内容完全相同的源文件只转换一次，其余输出以硬链接 / reflink / 复制生成"
+                             "（hardlink 与 reflink 不可用时自动回退）")
+    parser.add_argument("--io-readers", type=int, default=0,
+                        help="每个源设备（按 st_dev 区分）上同时读取的任务数上限（默认 0 不限制，机械硬盘/NAS 建议 1~2）")
+    parser.add_argument("--io-writers", type=int, default=0,
+                        help="目标设备上同时写入的任务数上限（默认 0 不限制）")
+    parser.add_argument("--order", choices=ORDERS, default="duration",
+                        help="调度顺序：duration 媒体时长最长优先（默认）/ size 大文件优先 / path 目录顺序 / inode 近似磁盘物理顺序（慢速磁盘上读取更连续）")
+    parser.add_argument("--shard", type=_shard_arg, default=None, metavar="I/N",
+                        help="多节点哈希分片：共 N 个节点时本节点处理第 I 片（I 从 0 开始），按相对路径哈希分工，无需协调")
+    parser.add_argument("--lease", action="store_true",
+                        help="多节点租约认领：各节点共享 src/dest，转换前在 dest/.mp4_to_mp3_leases/ 下认领文件，崩溃节点的文件在租约过期后被接管")
+    parser.add_argument("--lease-ttl", type=float, default=120.0,
+                        help="租约有效期（秒，默认 120）：持有者超过该时间未刷新即视为崩溃；须远大于各节点间的时钟误差")
+    parser.add_argument("--worker-id", default=None,
+                        help="节点标识（默认 主机名；分片模式默认 shard-I-of-N），用于区分各节点的清单、任务表与租约；"
+                             "同一台机器上运行多个租约节点时须各自指定")
+    parser.add_argument("--metrics-file", default=str(LOG_DIR / "conversion_metrics.jsonl"),
+                        help="单文件指标 JSON Lines 输出路径（默认 logs/conversion_metrics.jsonl，传空字符串关闭）")
+    parser.add_argument("--prometheus-file", default=None,
+                        help="Prometheus textfile collector 输出路径（.prom，可选）")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default="text",
+                        help="日志文件格式：text（默认）或 json（JSON Lines，写入 logs/skill_execution.jsonl）")
+    parser.add_argument("--profile", choices=sorted(env_manager.PROFILES), default=None,
+                        help="虚拟环境依赖档位（默认 minimal，仅安装 tqdm；ml 额外安装 PyTorch 等重型依赖）")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    env_manager.check_python_version()
-    env_manager.setup_venv()# 必须最先执行（包含 GPU 自动检测）
-    
-    if len(sys.argv) < 3:
-        print("用法: python extract.py <源目录> <目标目录>")
+    args = parse_args()
+    # 同一台机器上的多个节点进程各自写入带节点标识的日志文件，避免多个进程同时滚动同一个文件；
+    # 冷启动时 env_manager 已按默认参数初始化日志，这里按命令行参数重新配置
+    tag = sharding.state_tag(args.shard, args.lease, args.worker_id)
+    LoggerManager.setup_logger(logger_name=LOGGER_NAME, log_format=args.log_format, reconfigure=True,
+                               log_filename=f"skill_execution.{tag}.log" if tag else "skill_execution.log")
+
+    try:
+        extract_audio(args.src_dir, args.dest_dir, jobs=args.jobs, force=args.force, with_hash=args.with_hash,
+                      stream_copy=args.stream_copy, copy_aac=args.copy_aac,
+                      metrics_file=args.metrics_file or None, prometheus_file=args.prometheus_file,
+                      renditions=args.renditions, batch_max_bytes=args.batch_max_bytes,
+                      batch_file_size=args.batch_file_size, batch_max_files=args.batch_max_files,
+                      segment_min_duration=args.segment_min_duration, segment_count=args.segment_count,
+                      resume=args.resume, max_attempts=args.max_attempts,
+                      watch=args.watch, watch_settle=args.watch_settle, watch_poll=args.watch_poll,
+                      timeout_factor=args.timeout_factor, timeout_min=args.timeout_min,
+                      dedup=args.dedup, io_readers=args.io_readers, io_writers=args.io_writers,
+                      order=args.order, shard=args.shard, lease=args.lease, lease_ttl=args.lease_ttl,
+                      worker_id=args.worker_id)
+    except ExtractError as e:
+        logger.error(str(e))
         sys.exit(1)
-        
-    extract_audio(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    except KeyboardInterrupt:
+        logger.warning("任务被中断：已结束全部 FFmpeg 进程，可使用 --resume 继续。")
+        sys.exit(130)
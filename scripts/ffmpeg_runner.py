@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: FFmpeg 进程执行模块（带实时进度）。
+原先使用 subprocess.run(capture_output=True) 会把 stderr 全部缓存在内存中，并且在转换完成前拿不到任何进度。
+本模块改为：
+1、通过 -progress pipe:1 逐行读取 FFmpeg 的机器可读进度（out_time_us），实时回调已处理的媒体时长。
+2、stderr 由后台线程持续读取，只保留最后若干行用于错误日志，不会因输出过多而占满内存或阻塞管道。
+3、超时：损坏或截断的文件可能让 FFmpeg 无限挂起，调用方可按媒体时长传入超时，超时后强制结束该进程并返回失败。
+4、取消：在途进程登记在所属任务的 CancelToken 中，token.cancel() 会立即结束它们并拒绝启动新进程；
+   同一进程内并行运行的多个任务互不影响，cancel_all() 则取消全部任务（用于 Ctrl+C / SIGTERM）。
+   子进程运行在独立的会话中，终端的 Ctrl+C 不会直接打断 FFmpeg，统一由主进程负责结束，避免与清理逻辑竞争。
+"""
+
+import os
+import weakref
+import subprocess
+import threading
+from collections import deque
+
+STDERR_TAIL_LINES = 50
+CANCELLED_RETURNCODE = -1         # 取消后拒绝启动时返回的返回码
+
+_tokens = weakref.WeakSet()       # 存活的全部 CancelToken
+_tokens_lock = threading.Lock()
+
+class CancelToken:
+    """
+    取消令牌：登记一个任务的在途 FFmpeg 进程
+    cancel() 可在任意线程中调用，结束这些进程并拒绝该任务再启动新进程
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._active = set()
+        self._lock = threading.Lock()
+        with _tokens_lock:
+            _tokens.add(self)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            processes = list(self._active)
+        for process in processes:
+            _kill(process)
+
+    def wait(self, timeout=None):
+        """等待取消（至多 timeout 秒），返回是否已取消"""
+        return self._event.wait(timeout)
+
+    def _register(self, process):
+        with self._lock:
+            self._active.add(process)
+        if self.cancelled:        # 登记前恰好收到取消
+            _kill(process)
+
+    def _unregister(self, process):
+        with self._lock:
+            self._active.discard(process)
+
+_default_token = CancelToken()    # 未指定令牌的调用共用
+
+def _drain(stream, tail):
+    for line in iter(stream.readline, ""):
+        tail.append(line.rstrip())
+    stream.close()
+
+def cancel_all():
+    """取消全部任务：结束所有在途的 FFmpeg 进程，并拒绝这些任务再启动新进程"""
+    with _tokens_lock:
+        tokens = list(_tokens)
+    for token in tokens:
+        token.cancel()
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        pass                      # 进程已退出
+
+def with_progress(cmd):
+    """在 FFmpeg 命令中插入 -progress pipe:1（须放在输出文件之前的全局位置）"""
+    return [cmd[0], "-progress", "pipe:1", "-nostats"] + list(cmd[1:])
+
+def run_ffmpeg(cmd, on_progress=None, timeout=None, token=None):
+    """
+    执行 FFmpeg 命令
+    - on_progress: 回调 on_progress(已处理媒体秒数)，在当前线程中调用
+    - timeout: 超时秒数（None 表示不限制），超时后强制结束进程
+    - token: 所属任务的 CancelToken（None 时使用模块默认令牌）
+    :return: (returncode, stderr 末尾若干行, 最终处理的媒体秒数)
+    """
+    token = token or _default_token
+    if token.cancelled:
+        return CANCELLED_RETURNCODE, "任务已取消", 0.0
+    process = subprocess.Popen(
+        with_progress(cmd),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace",
+        start_new_session=(os.name == "posix"),
+    )
+    token._register(process)
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    drainer = threading.Thread(target=_drain, args=(process.stderr, tail), daemon=True)
+    drainer.start()
+    timed_out = threading.Event()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, lambda: (timed_out.set(), _kill(process)))
+        timer.daemon = True
+        timer.start()
+
+    media_seconds = 0.0
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        # out_time_us 与 out_time_ms 实际单位都是微秒（FFmpeg 历史遗留）
+        if key in ("out_time_us", "out_time_ms") and value.lstrip("-").isdigit():
+            media_seconds = max(media_seconds, int(value) / 1_000_000)
+            if on_progress:
+                on_progress(media_seconds)
+    process.stdout.close()
+    returncode = process.wait()
+    drainer.join()
+    if timer is not None:
+        timer.cancel()
+    token._unregister(process)
+    if timed_out.is_set():
+        tail.append(f"FFmpeg 超过 {timeout:.0f} 秒未完成，已强制结束")
+    elif token.cancelled and returncode != 0:
+        tail.append("任务已取消")
+    return returncode, "\n".join(tail).strip(), media_seconds
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 感知存储设备的 I/O 调度模块。
+源目录在机械硬盘 NAS、目标目录在本地 SSD 时，盲目并发的 FFmpeg 读取会让 NAS 磁头来回寻道，吞吐甚至低于串行。
+本模块让调度器知道每个任务读写的是哪块设备（按 st_dev 区分），并与 CPU 并发数（--jobs）分开限流：
+1、读并发：同一源设备上同时读取的任务数不超过 --io-readers（ffprobe 探测也计入）。
+2、写并发：同一目标设备上同时写入的任务数不超过 --io-writers。
+3、调度顺序：默认媒体时长最长的优先（时长来自探测索引），也可按文件大小（size）、目录顺序（path）或 inode 顺序（inode，近似磁盘上的物理分布）提交，让读取尽量连续。
+某个设备达到上限时，调度器会跳过它的任务、先提交其他设备上的任务，快速存储上的吞吐仍可随核心数扩展。
+4、总并发：同时运行的 FFmpeg 进程总数不超过 --jobs；超长文件分段编码时，额外的分段在工作线程中按需申请名额（见 DeviceSlots），
+   与普通任务共用同一份并发与设备名额，不会在每个文件内部再开一套并发。
+"""
+
+import os
+import threading
+from pathlib import Path
+
+ORDERS = ("duration", "size", "path", "inode")
+
+def device_of(path):
+    """路径所在设备（路径尚不存在时取最近的已存在上级目录）"""
+    path = Path(path)
+    for candidate in (path, *path.parents):
+        try:
+            return os.stat(candidate).st_dev
+        except OSError:
+            continue
+    return None
+
+def order_key(order, items, duration=None):
+    """
+    待调度任务的排序键（越小越先提交）
+    - items: [(mp4_file, rel_path, src_stat), ...]
+    - duration: 任务的媒体时长合计（秒），order="duration" 时使用，未知时按文件大小排序
+    """
+    if order == "duration" and duration is not None:
+        return -duration
+    if order == "path":
+        return 0                   # 相同键按发现顺序（即目录顺序）提交
+    if order == "inode":
+        st = items[0][2]
+        return (st.st_dev, st.st_ino)
+    return -sum(item[2].st_size for item in items)
+
+class DeviceLimiter:
+    """
+    按设备统计在途的读/写任务数，并限制 FFmpeg 进程总数（线程安全：主线程提交任务，工作线程申请分段名额）
+    max_readers / max_writers / max_jobs 为 0 表示不限制
+    """
+
+    def __init__(self, max_readers=0, max_writers=0, max_jobs=0):
+        self.max_readers = max_readers
+        self.max_writers = max_writers
+        self.max_jobs = max_jobs
+        self._readers = {}
+        self._writers = {}
+        self._jobs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.max_readers or self.max_writers)
+
+    @property
+    def full(self):
+        """FFmpeg 进程总数已达上限"""
+        return bool(self.max_jobs) and self._jobs >= self.max_jobs
+
+    @staticmethod
+    def _full(counts, devices, limit):
+        return bool(limit) and any(counts.get(dev, 0) >= limit for dev in devices)
+
+    def try_acquire(self, read_devices, write_devices, job=True):
+        """
+        名额充足时占用并返回 True，否则不占用并返回 False
+        - job: 是否占用 FFmpeg 进程总数名额（ffprobe 探测只占用设备读取名额）
+        """
+        with self._lock:
+            if ((job and self.full) or self._full(self._readers, read_devices, self.max_readers)
+                    or self._full(self._writers, write_devices, self.max_writers)):
+                return False
+            self._jobs += job
+            for dev in read_devices:
+                self._readers[dev] = self._readers.get(dev, 0) + 1
+            for dev in write_devices:
+                self._writers[dev] = self._writers.get(dev, 0) + 1
+            return True
+
+    def release(self, read_devices, write_devices, job=True):
+        with self._lock:
+            self._jobs -= job
+            for dev in read_devices:
+                self._readers[dev] -= 1
+            for dev in write_devices:
+                self._writers[dev] -= 1
+
+    def slots(self, read_devices, write_devices):
+        """绑定到一组设备的名额申请器，交给工作线程为同一任务申请额外的并发名额"""
+        return DeviceSlots(self, read_devices, write_devices)
+
+class DeviceSlots:
+    """
+    同一任务的额外并发名额（如超长文件的其他分段）：只在名额充足时非阻塞地申请，
+    申请不到时由任务自己的线程顺序完成，避免多个任务互相等待名额而死锁
+    """
+
+    def __init__(self, limiter, read_devices, write_devices):
+        self.limiter = limiter
+        self.read_devices = read_devices
+        self.write_devices = write_devices
+
+    def try_acquire(self):
+        return self.limiter.try_acquire(self.read_devices, self.write_devices)
+
+    def release(self):
+        self.limiter.release(self.read_devices, self.write_devices)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 基于 SQLite 的可恢复任务队列模块。
+大目录树（如 20 万个文件）转换到一半时，进程可能因 OOM、机器重启或 Ctrl-C 退出。本模块把已发现的任务持久化到输出目录下的 SQLite 数据库中：
+1、任务状态：pending（待处理）/ running（执行中）/ done（完成）/ failed（失败），并记录尝试次数、最后一次错误与输出文件。
+2、崩溃恢复：启动时把上次遗留的 running 任务改回 pending（这些任务的 FFmpeg 进程已随上次运行一起结束）；
+   开始执行时记录计划写入的输出，无论是否 --resume，启动时都据此清理这些任务留下的临时输出（与当前参数及源文件是否仍存在无关）。
+3、断点续跑：--resume 时直接沿用上次的任务表，已完成且源文件未变化的任务跳过，失败任务在未超过重试上限前重新执行。
+数据库使用 WAL 模式：状态变化（running/done/failed）立即提交，扫描阶段的批量登记按时间间隔合并提交；
+进程意外退出时最多丢失尚未开始执行的登记，这些文件下次会被重新发现，不会产生错误结果。
+只在主线程中访问数据库。
+"""
+
+import json
+import time
+import sqlite3
+from pathlib import Path
+
+QUEUE_NAME = ".mp4_to_mp3_jobs.sqlite3"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    rel_path   TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    state      TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    outputs    TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state);
+"""
+
+class JobQueue:
+    """
+    输出目录下的持久化任务表
+    用法:
+        queue = JobQueue.open(dest_path, resume=True)
+        queue.interrupted                   # 上次运行中断的任务 [(rel_path, 计划输出)]
+        queue.add(rel_path, src_stat)
+        queue.mark_running(rel_path, outputs) / queue.mark_done(rel_path, out_files) / queue.mark_failed(rel_path, error)
+        queue.close()
+    """
+
+    def __init__(self, path, commit_interval=1.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_interval = commit_interval
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._last_commit = time.monotonic()
+
+    @classmethod
+    def open(cls, dest_path, resume=False, tag=None):
+        """
+        打开任务表；非 --resume 运行时清空上次的任务，从头开始记录
+        - tag: 多节点运行时的节点标识，每个节点使用各自的数据库文件（SQLite 不能在共享文件系统上被多个进程同时写入）
+        清空之前先取出上次中断的任务（queue.interrupted），调用方据此清理它们的临时输出
+        """
+        name = f".mp4_to_mp3_jobs.{tag}.sqlite3" if tag else QUEUE_NAME
+        queue = cls(Path(dest_path) / name)
+        queue.interrupted = queue.recover_interrupted()
+        if not resume:
+            queue._conn.execute("DELETE FROM jobs")
+            queue._conn.commit()
+        return queue
+
+    @classmethod
+    def retire(cls, dest_path, retire):
+        """
+        删除已退出节点的任务表（其已完成的文件记录在清单中，并入当前节点后仍会跳过）
+        - retire: 判断函数 retire(节点标识)，为 True 时删除该节点的数据库文件
+        :return: {节点标识: 该节点中断的任务 [(相对路径, 计划输出)]}，调用方据此清理临时输出
+        """
+        retired = {}
+        for path in Path(dest_path).glob(".mp4_to_mp3_jobs.*.sqlite3"):
+            tag = path.name[len(".mp4_to_mp3_jobs."):-len(".sqlite3")]
+            if not retire(tag):
+                continue
+            try:
+                queue = cls(path)
+                try:
+                    retired[tag] = queue.recover_interrupted()
+                finally:
+                    queue.close()
+            except sqlite3.Error:
+                retired[tag] = []         # 损坏的任务表直接删除
+            for suffix in ("", "-wal", "-shm"):
+                path.with_name(path.name + suffix).unlink(missing_ok=True)
+        return retired
+
+    @staticmethod
+    def key(rel_path):
+        return Path(rel_path).as_posix()
+
+    def _maybe_commit(self):
+        if time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._last_commit = time.monotonic()
+
+    def recover_interrupted(self):
+        """
+        把上次运行遗留的 running 任务改回 pending
+        :return: [(相对路径, 计划输出)]，计划输出为 mark_running 时记录的相对路径列表（早期记录为 None）
+        """
+        rows = self._conn.execute("SELECT rel_path, outputs FROM jobs WHERE state = ?", (RUNNING,)).fetchall()
+        self._conn.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?",
+                           (PENDING, time.time(), RUNNING))
+        self.commit()
+        return [(Path(rel_path), json.loads(outputs) if outputs else None) for rel_path, outputs in rows]
+
+    def lookup(self, rel_path, src_stat):
+        """
+        查询上次记录的任务（源文件大小或修改时间变化时视为新任务，返回 None）
+        :return: (state, attempts, outputs) 或 None
+        """
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, state, attempts, outputs FROM jobs WHERE rel_path = ?",
+            (self.key(rel_path),),
+        ).fetchone()
+        if row is None or row[0] != src_stat.st_size or row[1] != src_stat.st_mtime_ns:
+            return None
+        return row[2], row[3], json.loads(row[4]) if row[4] else []
+
+    def add(self, rel_path, src_stat):
+        """登记一个待处理任务；源文件未变化时保留已有的尝试次数"""
+        self._conn.execute(
+            """INSERT INTO jobs (rel_path, size, mtime_ns, state, attempts, updated_at)
+               VALUES (?, ?, ?, ?, 0, ?)
+               ON CONFLICT(rel_path) DO UPDATE SET
+                   attempts = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                                   THEN attempts ELSE 0 END,
+                   size = excluded.size, mtime_ns = excluded.mtime_ns,
+                   state = excluded.state, updated_at = excluded.updated_at""",
+            (self.key(rel_path), src_stat.st_size, src_stat.st_mtime_ns, PENDING, time.time()),
+        )
+        self._maybe_commit()
+
+    def mark_running(self, rel_path, outputs=None):
+        """outputs 为计划写入的输出（相对输出根目录的 posix 路径），进程被强制结束后据此清理临时输出"""
+        self._conn.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, outputs = ?, updated_at = ? WHERE rel_path = ?",
+            (RUNNING, json.dumps(list(outputs), ensure_ascii=False) if outputs is not None else None,
+             time.time(), self.key(rel_path)),
+        )
+        self.commit()
+
+    def mark_done(self, rel_path, outputs):
+        """outputs 为相对于输出根目录的 posix 路径列表"""
+        self._conn.execute(
+            "UPDATE jobs SET state = ?, last_error = NULL, outputs = ?, updated_at = ? WHERE rel_path = ?",
+            (DONE, json.dumps(list(outputs), ensure_ascii=False), time.time(), self.key(rel_path)),
+        )
+        self.commit()
+
+    def mark_failed(self, rel_path, error):
+        self._conn.execute(
+            "UPDATE jobs SET state = ?, last_error = ?, updated_at = ? WHERE rel_path = ?",
+            (FAILED, (error or "")[-2000:], time.time(), self.key(rel_path)),
+        )
+        self.commit()
+
+    def counts(self):
+        """各状态的任务数"""
+        return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
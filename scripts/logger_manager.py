@@ -9,48 +9,172 @@ Description: 这段代码定义了一个名为 LoggerManager 的类，专门用
 它通过封装 Python 的 logging 模块，为项目提供了一个既能输出到控制台，又能自动按天滚动保存的日志工具。
 智能目录管理：利用 pathlib 自动检查并创建日志目录（LOG_DIR），防止因文件夹不存在而报错。
 1、双通道输出：
-    1、控制台 (Stdout)：方便开发者在运行程序时实时查看状态。
+    1、控制台 (Stdout)：方便开发者在运行程序时实时查看状态；进度条存在时通过 tqdm.write 输出，不会打断进度条。
     2、文件 (File)：持久化记录运行日志，便于后续排查问题。
 2、自动滚动备份：使用了 TimedRotatingFileHandler，设置每 1天 滚动一次日志文件，并保留最近 3天 的记录，有效防止日志文件无限增大占用硬盘空间。
 3、防止日志重复：通过 if not logger.handlers 判断，确保在多次调用初始化方法时，不会重复绑定处理器（Handler），避免出现一行日志被打印多次的情况。
+4、非阻塞日志：默认使用 QueueHandler + QueueListener，业务线程只把日志记录放入队列，格式化、写文件与滚动都由唯一的后台线程完成，
+   日志盘再慢也不会拖慢转换，多个工作线程的输出也不会交错。
+5、结构化日志：log_format="json" 时日志文件为 JSON Lines，每行一条记录，通过 extra 传入的 path / duration / returncode 作为独立字段输出；
+   extra 中带 file_only=True 的记录（如逐文件明细）只写入日志文件，不输出到控制台。
+6、多进程：TimedRotatingFileHandler 不支持多个进程写入并滚动同一个文件，同一台机器上并行运行多个进程（如多节点租约模式）时，
+   每个进程应通过 log_filename 使用各自的日志文件（extract.py 按节点标识自动区分）。
 """
 
-import logging
 import sys
-from pathlib import Path
-from logging.handlers import TimedRotatingFileHandler
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from config import LOG_DIR
 
+# 通过 extra 传入、在 JSON 日志中作为独立字段输出的属性
+STRUCTURED_FIELDS = ("path", "duration", "returncode")
+LOG_FORMATS = ("text", "json")
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON"""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in STRUCTURED_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class TqdmSafeHandler(logging.StreamHandler):
+    """控制台输出：tqdm 已加载时改用 tqdm.write，避免日志行与进度条互相覆盖"""
+
+    def emit(self, record):
+        if getattr(record, "file_only", False):     # 逐文件明细只写入日志文件，不刷屏
+            return
+        tqdm = getattr(sys.modules.get("tqdm"), "tqdm", None)
+        if tqdm is None:
+            super().emit(record)
+            return
+        try:
+            tqdm.write(self.format(record), file=self.stream)
+        except Exception:
+            self.handleError(record)
+
 class LoggerManager:
+    _queue = None                 # 非阻塞模式下所有 logger 共用的队列
+    _listener = None
+    _handlers = {}                # logger_name -> 实际输出的 handler 列表（由监听线程调用）
+
     @staticmethod
-    def setup_logger(logger_name: str = "log", log_filename: str = "skill_execution.log"):
+    def _build_handlers(log_file, log_format):
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+        # 文件输出 Handler
+        file_handler = TimedRotatingFileHandler(
+            log_file, when="D", interval=1, backupCount=3, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonLinesFormatter() if log_format == "json" else formatter)
+
+        # 控制台输出 Handler（始终为便于阅读的文本格式）
+        console_handler = TqdmSafeHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        return [file_handler, console_handler]
+
+    @classmethod
+    def _ensure_listener(cls):
+        if cls._listener is None:
+            cls._queue = queue.SimpleQueue()          # 无界队列，放入日志永不阻塞
+            cls._listener = QueueListener(cls._queue, _DispatchHandler(cls._handlers),
+                                          respect_handler_level=True)
+            cls._listener.start()
+            atexit.register(cls.shutdown)
+        return cls._queue
+
+    @classmethod
+    def setup_logger(cls, logger_name: str = "log", log_filename: str = "skill_execution.log",
+                     use_queue: bool = True, log_format: str = "text", reconfigure: bool = False):
         """
         初始化并配置日志记录器
-        :param log_dir: 日志保存目录 (Path 对象)
         :param logger_name: logger 的名称
-        :param log_filename: 日志文件的名称
+        :param log_filename: 日志文件的名称（json 格式时后缀自动改为 .jsonl）
+        :param use_queue: 是否使用非阻塞的队列模式（默认开启）
+        :param log_format: 日志文件格式，text 或 json
+        :param reconfigure: 已初始化时是否按新参数重新配置（如命令行指定了 --log-format）
         """
         # 确保日志目录存在 (parents=True 确保父级目录也会被创建)
         LOG_DIR.mkdir(parents=True, exist_ok=True)
         log_file = LOG_DIR / log_filename
-        
+        if log_format == "json":
+            log_file = log_file.with_suffix(".jsonl")
+
         logger = logging.getLogger(logger_name)
         logger.setLevel(logging.INFO)
-        
+        logger.propagate = False
+
+        if reconfigure and logger.handlers:
+            cls._detach(logger_name, logger)
+
         # 避免在多次调用时重复添加 handler 导致日志重复输出
         if not logger.handlers:
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            
-            # 文件输出 Handler
-            file_handler = TimedRotatingFileHandler(
-                log_file, when="D", interval=1, backupCount=3, encoding="utf-8"
-            )
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-            
-            # 控制台输出 Handler
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
-        
-        return logger
\ No newline at end of file
+            handlers = cls._build_handlers(log_file, log_format)
+            if use_queue:
+                cls._handlers[logger_name] = handlers
+                logger.addHandler(QueueHandler(cls._ensure_listener()))
+            else:
+                for handler in handlers:
+                    logger.addHandler(handler)
+
+        return logger
+
+    @classmethod
+    def _detach(cls, logger_name, logger):
+        if cls._listener is not None:
+            cls.flush()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for handler in cls._handlers.pop(logger_name, []):
+            handler.close()
+
+    @classmethod
+    def flush(cls):
+        """等待队列中已有的日志全部输出（重启监听线程实现）"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener.start()
+
+    @classmethod
+    def shutdown(cls):
+        """停止监听线程并输出剩余日志（进程退出或 exec 替换进程前调用）"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+        for handlers in cls._handlers.values():
+            for handler in handlers:
+                try:
+                    handler.flush()
+                except (OSError, ValueError):
+                    pass              # 控制台流可能已被宿主关闭（如嵌入调用或测试框架退出时）
+
+class _DispatchHandler(logging.Handler):
+    """监听线程中按 logger 名称把记录分发给对应的 handler"""
+
+    def __init__(self, handlers):
+        super().__init__()
+        self.handlers = handlers
+
+    def handle(self, record):
+        for handler in self.handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 转换清单（Manifest）管理模块，用于支持增量重跑。
+清单以 JSON 文件形式保存在输出目录下，按源文件的相对路径记录每次成功转换的信息：
+1、源文件指纹：文件大小、修改时间（纳秒），以及可选的内容哈希（sha256）。
+2、编码参数：记录生成输出时使用的编码设置，设置变化后会自动重新转换。
+3、输出校验：记录每个输出文件的相对路径（流复制时后缀可能是 .m4a，多规格时有多个输出）与大小，输出缺失或大小不符（如上次中断留下的半成品）时判定为需要重新转换。
+判断是否跳过只依赖 stat 信息，10 万个未变化的文件也只需数秒；只有在大小一致但修改时间变化时才会计算哈希。
+多节点运行时每个节点只写入自己的清单文件（.mp4_to_mp3_manifest.<节点标识>.json），同时只读加载其他节点的清单参与增量判断
+（文件命名、按写入时间合并与落盘规则见 tagged_state 模块）。
+"""
+
+import hashlib
+from pathlib import Path
+from tagged_state import TaggedState
+
+MANIFEST_NAME = ".mp4_to_mp3_manifest.json"
+MANIFEST_VERSION = 3
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的 sha256（分块读取，避免大文件占用内存）"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ConversionManifest(TaggedState):
+    """
+    输出目录下的转换清单
+    用法:
+        manifest = ConversionManifest.load(dest_path)
+        if not manifest.is_current(rel_path, src_stat, dest_path, settings): ...
+        manifest.record(rel_path, src_stat, dest_path, out_files, settings)
+        manifest.save()
+    """
+
+    NAME = MANIFEST_NAME
+    VERSION = MANIFEST_VERSION
+
+    def is_current(self, rel_path, src_stat, dest_path, settings, src_file=None):
+        """
+        判断输出是否仍然有效（可跳过）
+        :param src_stat: 源文件的 os.stat_result
+        :param dest_path: 输出根目录（输出文件路径取自清单记录）
+        :param settings: 当前编码设置（dict）
+        :param src_file: 传入时启用内容哈希比对（仅在修改时间变化时才计算）
+        """
+        entry = self.lookup(rel_path)
+        if not entry or entry.get("settings") != settings:
+            return False
+        if entry.get("size") != src_stat.st_size or not entry.get("outputs"):
+            return False
+
+        # 任一输出缺失或大小不符，说明被删除或是上次中断留下的半成品
+        try:
+            for output, output_size in entry["outputs"]:
+                if (Path(dest_path) / output).stat().st_size != output_size:
+                    return False
+        except (OSError, TypeError, ValueError):
+            return False
+
+        if entry.get("mtime_ns") == src_stat.st_mtime_ns:
+            return True
+
+        # 大小一致但修改时间变化（如被复制/touch 过），用内容哈希确认
+        if src_file is None or not entry.get("hash"):
+            return False
+        try:
+            if file_digest(src_file) != entry["hash"]:
+                return False
+        except OSError:
+            return False
+        self.entries[self.key(rel_path)] = dict(entry, mtime_ns=src_stat.st_mtime_ns)
+        self._dirty = True
+        return True
+
+    def record(self, rel_path, src_stat, dest_path, out_files, settings, digest=None):
+        """记录一次成功的转换（out_files 为本次生成的全部输出文件）"""
+        self.store(rel_path, {
+            "size": src_stat.st_size,
+            "mtime_ns": src_stat.st_mtime_ns,
+            "hash": digest,
+            "settings": settings,
+            "outputs": [
+                [Path(f).relative_to(dest_path).as_posix(), Path(f).stat().st_size] for f in out_files
+            ],
+        })
+
+    def outputs(self, rel_path, dest_path):
+        """清单中记录的输出文件（绝对路径）"""
+        entry = self.lookup(rel_path) or {}
+        return [Path(dest_path) / output for output, _ in entry.get("outputs") or []]
+
+    def forget(self, rel_path):
+        """移除记录（转换失败时调用，确保下次重新转换）"""
+        if self.entries.pop(self.key(rel_path), None) is not None:
+            self._dirty = True
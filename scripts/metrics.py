@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 单文件指标与运行遥测导出模块。
+为每次转换记录排队等待、FFmpeg 耗时、输入/输出字节数、媒体时长与实时倍率（媒体秒数 / 耗时），并导出到：
+1、JSON Lines 文件：每个文件一行（type=file），任务结束追加一行汇总（type=run_summary），便于用 jq / pandas 分析。
+2、Prometheus textfile collector（可选）：任务结束时原子写入 .prom 文件，供 node_exporter 采集。
+汇总中包含 p50/p95/p99 耗时以及最慢的若干个文件。
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+SLOWEST_COUNT = 5
+
+@dataclass
+class FileMetrics:
+    """单个文件的转换指标"""
+    path: str
+    status: str                            # success / failed
+    mode: Optional[str] = None             # copy / transcode
+    queue_wait: float = 0.0                # 提交到开始执行的等待时间（秒）
+    wall_time: float = 0.0                 # FFmpeg 墙钟耗时（秒，含探测）
+    input_bytes: int = 0
+    output_bytes: int = 0
+    media_duration: Optional[float] = None # 媒体时长（秒）
+    realtime_factor: Optional[float] = None
+    returncode: Optional[int] = None
+
+    def finalize(self):
+        """根据媒体时长与耗时计算实时倍率"""
+        if self.media_duration and self.wall_time > 0:
+            self.realtime_factor = round(self.media_duration / self.wall_time, 3)
+        return self
+
+def percentile(values, pct):
+    """最近秩法百分位数（values 需已排序）"""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[k]
+
+class MetricsRecorder:
+    """
+    指标收集与导出（只在主线程中调用）
+    用法:
+        recorder = MetricsRecorder(jsonl_path, prometheus_path)
+        recorder.add(FileMetrics(...))
+        summary = recorder.close()
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        self.records = []
+        self.skipped = 0                   # 增量跳过的文件只计数，不逐条写入
+        self._fp = None
+        if jsonl_path:
+            Path(jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+            self._fp = open(jsonl_path, "a", encoding="utf-8")
+
+    def add(self, metrics):
+        metrics.finalize()
+        self.records.append(metrics)
+        if self._fp:
+            line = dict(type="file", run_id=self.run_id, ts=round(time.time(), 3), **asdict(metrics))
+            self._fp.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self._fp.flush()
+
+    def count_skipped(self, n=1):
+        self.skipped += n
+
+    def summary(self):
+        done = self.records          # 只包含实际执行过转换的文件（成功/失败）
+        walls = sorted(m.wall_time for m in done)
+        slowest = sorted(done, key=lambda m: m.wall_time, reverse=True)[:SLOWEST_COUNT]
+        counts = {"skipped": self.skipped}
+        for m in self.records:
+            counts[m.status] = counts.get(m.status, 0) + 1
+        return {
+            "run_id": self.run_id,
+            "started_at": round(self.started_at, 3),
+            "run_seconds": round(time.perf_counter() - self._t0, 3),
+            "files": counts,
+            "input_bytes": sum(m.input_bytes for m in done),
+            "output_bytes": sum(m.output_bytes for m in done),
+            "media_seconds": round(sum(m.media_duration or 0 for m in done), 3),
+            "wall_p50": percentile(walls, 50),
+            "wall_p95": percentile(walls, 95),
+            "wall_p99": percentile(walls, 99),
+            "queue_wait_p95": percentile(sorted(m.queue_wait for m in done), 95),
+            "slowest": [{"path": m.path, "wall_time": round(m.wall_time, 3)} for m in slowest],
+        }
+
+    def write_prometheus(self, summary):
+        """写入 Prometheus textfile collector 格式（先写临时文件再原子替换）"""
+        lines = [
+            "# HELP mp4_extractor_files_total Files processed in the last run by status.",
+            "# TYPE mp4_extractor_files_total gauge",
+        ]
+        for status, count in sorted(summary["files"].items()):
+            lines.append(f'mp4_extractor_files_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP mp4_extractor_file_seconds Per-file conversion wall time quantiles in the last run.",
+            "# TYPE mp4_extractor_file_seconds summary",
+        ]
+        for q, key in (("0.5", "wall_p50"), ("0.95", "wall_p95"), ("0.99", "wall_p99")):
+            if summary[key] is not None:
+                lines.append(f'mp4_extractor_file_seconds{{quantile="{q}"}} {summary[key]:.6f}')
+        gauges = (
+            ("run_seconds", "Wall time of the last run."),
+            ("input_bytes", "Input bytes converted in the last run."),
+            ("output_bytes", "Output bytes written in the last run."),
+            ("media_seconds", "Media seconds converted in the last run."),
+            ("started_at", "Unix time the last run started."),
+        )
+        for key, help_text in gauges:
+            lines += [
+                f"# HELP mp4_extractor_{key} {help_text}",
+                f"# TYPE mp4_extractor_{key} gauge",
+                f"mp4_extractor_{key} {summary[key]}",
+            ]
+        self.prometheus_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+        tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp_path, self.prometheus_path)
+
+    def close(self):
+        """写入汇总并关闭文件，返回汇总 dict"""
+        summary = self.summary()
+        if self._fp:
+            self._fp.write(json.dumps(dict(type="run_summary", **summary), ensure_ascii=False) + "\n")
+            self._fp.close()
+            self._fp = None
+        if self.prometheus_path:
+            self.write_prometheus(summary)
+        return summary
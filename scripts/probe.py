@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 基于 ffprobe 的媒体探测模块。
+在正式转换前先探测视频中第一条音频流的编码格式、码率等信息，据此选择转换方式：
+1、音频本身就是 MP3：直接 -c:a copy 封装为 .mp3，无损且比重新编码快 50~100 倍。
+2、音频是 AAC 且允许输出 .m4a（--copy-aac）：直接 -c:a copy 封装为 .m4a。
+3、其他情况：沿用原有的 libmp3lame 重新编码流程。
+系统中没有 ffprobe 或探测失败时返回 None，调用方应回退到重新编码。
+"""
+
+import json
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+# 可直接流复制的编码 -> 输出后缀
+COPY_CONTAINERS = {
+    "mp3": ".mp3",
+    "aac": ".m4a",
+}
+
+@dataclass
+class AudioInfo:
+    """ffprobe 探测结果（只关注第一条音频流）"""
+    has_audio: bool
+    codec: Optional[str] = None
+    bit_rate: Optional[int] = None
+    channels: Optional[int] = None
+    sample_rate: Optional[int] = None
+    duration: Optional[float] = None
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def ffprobe_available():
+    return shutil.which("ffprobe") is not None
+
+def probe_file(path, timeout=60):
+    """
+    探测单个文件的音频信息
+    :return: AudioInfo；ffprobe 不可用或探测失败时返回 None
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,bit_rate,channels,sample_rate:format=duration",
+        "-of", "json", str(path),
+    ]
+    try:
+        process = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if process.returncode != 0:
+        return None
+    try:
+        data = json.loads(process.stdout or "{}")
+    except ValueError:
+        return None
+
+    duration = _to_float(data.get("format", {}).get("duration"))
+    streams = data.get("streams") or []
+    if not streams:
+        return AudioInfo(has_audio=False, duration=duration)
+
+    stream = streams[0]
+    return AudioInfo(
+        has_audio=True,
+        codec=stream.get("codec_name"),
+        bit_rate=_to_int(stream.get("bit_rate")),
+        channels=_to_int(stream.get("channels")),
+        sample_rate=_to_int(stream.get("sample_rate")),
+        duration=duration,
+    )
+
+def choose_mode(info, stream_copy=True, copy_aac=False):
+    """
+    根据探测结果选择转换方式
+    :return: (mode, suffix)，mode 为 "copy" 或 "transcode"
+    """
+    if stream_copy and info is not None and info.has_audio:
+        suffix = COPY_CONTAINERS.get(info.codec)
+        if suffix == ".mp3" or (suffix == ".m4a" and copy_aac):
+            return "copy", suffix
+    return "transcode", ".mp3"
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 媒体探测索引（ffprobe 结果缓存）模块。
+原先每个文件要等到工作线程开始转换时才探测，没有音频流的文件也要占用一个转换名额才报错，调度与进度也只能按文件数估算。
+本模块把探测提前为独立阶段，并把结果缓存到输出目录下的 JSON 索引中：
+1、缓存键：源文件相对路径，记录大小与修改时间（纳秒），两者任一变化即视为失效、重新探测。
+2、缓存内容：时长、音频编码、码率、声道数、采样率，以及是否存在音频流；探测失败（如 ffprobe 不可用）不写入缓存。
+3、用途：没有音频流的文件在提交转换前直接跳过；调度按媒体时长从长到短提交；进度条按剩余媒体秒数估算剩余时间。
+重跑时探测结果直接取自缓存，不再启动 ffprobe 进程。
+多节点运行时每个节点写入自己的索引文件，并只读加载其他节点的索引（规则同转换清单，见 tagged_state 模块）。
+"""
+
+from dataclasses import asdict
+from probe import AudioInfo
+from tagged_state import TaggedState
+
+PROBE_INDEX_NAME = ".mp4_to_mp3_probe.json"
+PROBE_INDEX_VERSION = 1
+ESTIMATE_BITRATE = 500 * 1000  # 时长未知时按该码率（bit/s）由文件大小估算
+
+def estimate_duration(size):
+    """由文件大小粗略估算媒体时长（秒），仅用于排序、超时与剩余时间估算"""
+    return size / (ESTIMATE_BITRATE / 8)
+
+class ProbeIndex(TaggedState):
+    """
+    输出目录下的探测结果缓存（只在主线程中调用）
+    用法:
+        index = ProbeIndex.load(dest_path)
+        info = index.get(rel_path, src_stat)     # None 表示未缓存或已失效
+        index.put(rel_path, src_stat, probe_file(mp4_file))
+        index.save()
+    """
+
+    NAME = PROBE_INDEX_NAME
+    VERSION = PROBE_INDEX_VERSION
+
+    def __init__(self, path, entries=None, autosave_interval=30.0, shared=None):
+        super().__init__(path, entries, autosave_interval, shared)
+        self.hits = 0
+        self.probed = 0
+
+    def get(self, rel_path, src_stat):
+        """:return: 缓存的 AudioInfo；未缓存或源文件已变化时返回 None"""
+        entry = self.lookup(rel_path)
+        if (not entry or entry.get("size") != src_stat.st_size
+                or entry.get("mtime_ns") != src_stat.st_mtime_ns):
+            return None
+        try:
+            info = AudioInfo(**entry["info"])
+        except (KeyError, TypeError):
+            return None
+        self.hits += 1
+        return info
+
+    def put(self, rel_path, src_stat, info):
+        """记录一次探测结果（info 为 None 表示探测失败，不缓存）"""
+        self.probed += 1
+        if info is None:
+            return
+        self.store(rel_path, {
+            "size": src_stat.st_size,
+            "mtime_ns": src_stat.st_mtime_ns,
+            "info": asdict(info),
+        })
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 多规格（rendition）输出模块。
+通过 --renditions 一次性指定多种输出规格，例如 "64k,192k,opus:96k"：
+1、每个源文件只启动一个 FFmpeg 进程、只解复用和解码一次，解码后的音频同时送入多个编码器，分别写出各规格的文件。
+2、每个规格输出到目标目录下独立的子目录（如 mp3_64k/、opus_96k/），并各自保持原有的目录结构。
+3、总的解码与磁盘读取开销只与源文件数量有关，而不是 源文件数 × 规格数。
+规格写法：[编码:]码率，编码可选 mp3（默认）、opus、aac。
+"""
+
+from dataclasses import dataclass
+
+# 编码名 -> (FFmpeg 编码器, 输出后缀)
+CODECS = {
+    "mp3": ("libmp3lame", ".mp3"),
+    "opus": ("libopus", ".opus"),
+    "aac": ("aac", ".m4a"),
+}
+DEFAULT_CODEC = "mp3"
+
+@dataclass(frozen=True)
+class Rendition:
+    """单个输出规格"""
+    codec: str          # mp3 / opus / aac
+    bitrate: str        # 如 "192k"
+
+    @property
+    def name(self):
+        """输出子目录名，如 mp3_192k"""
+        return f"{self.codec}_{self.bitrate}"
+
+    @property
+    def encoder(self):
+        return CODECS[self.codec][0]
+
+    @property
+    def suffix(self):
+        return CODECS[self.codec][1]
+
+    def ffmpeg_args(self, input_index=0):
+        """该规格对应的输出参数（放在输出文件名之前）；input_index 为多输入命令中的输入序号"""
+        return ["-map", f"{input_index}:a:0", "-c:a", self.encoder, "-b:a", self.bitrate]
+
+def _valid_bitrate(value):
+    return value[:-1].isdigit() and value[-1:].lower() == "k" and int(value[:-1]) > 0
+
+def parse_renditions(spec):
+    """
+    解析规格字符串，如 "64k,192k,opus:96k"
+    :raise ValueError: 编码未知、码率格式错误或规格重复
+    """
+    renditions = []
+    for item in (part.strip() for part in spec.split(",")):
+        if not item:
+            continue
+        codec, _, bitrate = item.rpartition(":")
+        codec = (codec or DEFAULT_CODEC).lower()
+        bitrate = bitrate.lower()
+        if codec not in CODECS:
+            raise ValueError(f"未知的编码: {codec}（可选: {', '.join(CODECS)}）")
+        if not _valid_bitrate(bitrate):
+            raise ValueError(f"码率格式错误: {bitrate}（示例: 96k）")
+        rendition = Rendition(codec, bitrate)
+        if rendition in renditions:
+            raise ValueError(f"重复的规格: {item}")
+        renditions.append(rendition)
+    if not renditions:
+        raise ValueError("至少需要一个输出规格")
+    return renditions
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 超长视频的分段并行编码模块。
+单个 6 小时的录像只能由一个核心编码，无论开多少并发都会成为整次任务的“尾巴”。
+本模块把音频按时间切成若干段并行编码，再在 MP3 帧级别拼接成一个无缝（gapless）的完整文件：
+1、帧对齐切分：分段边界取 1152 样本（一个 MP3 帧）的整数倍，保证各段编码出的帧与整段编码时的帧位置一一对应。
+2、预滚/后滚：每段向前、向后多编码若干帧，拼接时丢弃，使编码器的心理声学与 MDCT 状态在边界处已稳定。
+3、关闭比特池（-reservoir 0）：每一帧的数据都自包含，不同段的帧可以直接按字节拼接。
+4、时长头：复用第一段的 Xing/Info 帧，改写总帧数、总字节数、LAME 标签中的首尾补齐样本数并重算标签 CRC，
+   播放器能得到正确时长，支持 gapless 的解码器也能精确裁掉首尾补齐。
+5、共享并发名额：调用线程自己顺序编码各段，额外的并行分段只在调度器还有空闲名额时才启动（见 io_scheduler.DeviceSlots），
+   多个超长文件同时编码时，FFmpeg 进程总数仍不超过 --jobs，源设备的读取并发也仍受 --io-readers 限制。
+墙钟时间可降到约 时长 ÷ 空闲核心数。
+"""
+
+import math
+import shutil
+import threading
+from pathlib import Path
+
+from ffmpeg_runner import run_ffmpeg
+
+FRAME_SAMPLES = 1152               # MPEG-1 Layer III 每帧样本数
+PREROLL_FRAMES = 8                 # 每段向前多编码的帧数（拼接时丢弃）
+POSTROLL_FRAMES = 8                # 每段向后多编码的帧数（拼接时丢弃）
+MIN_SEGMENT_SECONDS = 60           # 单段最短时长，避免切得过碎
+MPEG1_SAMPLE_RATES = (44100, 48000, 32000)
+MPEG1_L3_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+
+class SegmentError(Exception):
+    """分段编码或拼接失败（调用方应回退到整段编码）"""
+
+def _crc16_arc(data):
+    """CRC-16/ARC（LAME 标签 CRC 使用的算法）"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+def parse_frame_header(data, offset):
+    """
+    解析 MPEG-1 Layer III 帧头
+    :return: (帧长度, 是否单声道)；不是合法帧头时返回 None
+    """
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset:offset + 4]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    if (b1 >> 3) & 0x03 != 0x03 or (b1 >> 1) & 0x03 != 0x01:  # 只支持 MPEG-1 Layer III
+        return None
+    bitrate_index, sr_index = b2 >> 4, (b2 >> 2) & 0x03
+    if bitrate_index in (0, 15) or sr_index == 3:
+        return None
+    length = 144000 * MPEG1_L3_BITRATES[bitrate_index] // MPEG1_SAMPLE_RATES[sr_index] + ((b2 >> 1) & 0x01)
+    return length, (b3 >> 6) == 0x03
+
+def split_frames(data):
+    """
+    把 MP3 文件内容切分为帧（跳过 ID3v2 标签）
+    :return: (Info 帧或 None, [音频帧, ...])
+    """
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size
+
+    frames = []
+    while offset < len(data):
+        header = parse_frame_header(data, offset)
+        if header is None:
+            if data[offset:offset + 3] == b"TAG":    # ID3v1 尾标签
+                break
+            raise SegmentError(f"无效的 MP3 帧（偏移 {offset}）")
+        length, _ = header
+        frames.append(data[offset:offset + length])
+        offset += length
+
+    info = None
+    if frames:
+        _, mono = parse_frame_header(frames[0], 0)
+        side = 4 + (17 if mono else 32)
+        if frames[0][side:side + 4] in (b"Xing", b"Info"):
+            info = frames.pop(0)
+    return info, frames
+
+def _lame_tag_offsets(info_frame):
+    """返回 (Xing 起始偏移, LAME 标签起始偏移或 None)"""
+    _, mono = parse_frame_header(info_frame, 0)
+    xing = 4 + (17 if mono else 32)
+    flags = int.from_bytes(info_frame[xing + 4:xing + 8], "big")
+    lame = xing + 8
+    lame += 4 if flags & 0x01 else 0     # 帧数
+    lame += 4 if flags & 0x02 else 0     # 字节数
+    lame += 100 if flags & 0x04 else 0   # TOC
+    lame += 4 if flags & 0x08 else 0     # 质量
+    if info_frame[lame:lame + 4] not in (b"LAME", b"Lavf", b"Lavc") or lame + 36 > len(info_frame):
+        lame = None
+    return xing, lame
+
+def read_padding(info_frame):
+    """读取 LAME 标签中的 (首部延迟, 尾部补齐) 样本数"""
+    _, lame = _lame_tag_offsets(info_frame)
+    if lame is None:
+        return None
+    v = int.from_bytes(info_frame[lame + 21:lame + 24], "big")
+    return v >> 12, v & 0x0FFF
+
+def rewrite_info_frame(info_frame, frame_count, total_bytes, end_padding=None):
+    """改写 Info 帧中的总帧数、总字节数与尾部补齐，并重算 LAME 标签 CRC"""
+    frame = bytearray(info_frame)
+    xing, lame = _lame_tag_offsets(info_frame)
+    flags = int.from_bytes(frame[xing + 4:xing + 8], "big")
+    pos = xing + 8
+    if flags & 0x01:
+        frame[pos:pos + 4] = frame_count.to_bytes(4, "big")
+        pos += 4
+    if flags & 0x02:
+        frame[pos:pos + 4] = total_bytes.to_bytes(4, "big")
+        pos += 4
+    if flags & 0x04:
+        # CBR 的 TOC 为线性映射
+        frame[pos:pos + 100] = bytes(min(255, i * 256 // 100) for i in range(100))
+    if lame is not None:
+        if end_padding is not None:
+            v = int.from_bytes(frame[lame + 21:lame + 24], "big")
+            v = (v & 0xFFF000) | (max(0, min(end_padding, 0x0FFF)))
+            frame[lame + 21:lame + 24] = v.to_bytes(3, "big")
+        frame[lame + 28:lame + 32] = total_bytes.to_bytes(4, "big")
+        frame[lame + 32:lame + 34] = b"\x00\x00"   # 音频数据 CRC：解码器不校验，拼接后不再计算
+        frame[lame + 34:lame + 36] = _crc16_arc(bytes(frame[:lame + 34])).to_bytes(2, "little")
+    return bytes(frame)
+
+def choose_sample_rate(sample_rate):
+    """输出采样率必须是 MPEG-1 支持的采样率，其他情况统一为 44100"""
+    return sample_rate if sample_rate in MPEG1_SAMPLE_RATES else 44100
+
+def plan_segments(duration, sample_rate, count):
+    """
+    规划分段边界（单位：帧）
+    :return: [(起始帧, 结束帧或 None), ...]，最后一段结束帧为 None 表示到文件末尾
+    """
+    total_frames = int(duration * sample_rate) // FRAME_SAMPLES
+    count = max(1, min(count, int(duration // MIN_SEGMENT_SECONDS)))
+    step = math.ceil(total_frames / count)
+    bounds = [i * step for i in range(count)] + [None]
+    return [(bounds[i], bounds[i + 1]) for i in range(count)]
+
+def build_segment_cmd(mp4_file, out_file, start_frame, end_frame, sample_rate, bitrate):
+    """构造单段编码命令（含预滚/后滚），返回 (命令, 该段第一帧对应的全局帧号)"""
+    enc_start = max(0, start_frame - PREROLL_FRAMES)
+    cmd = ["ffmpeg", "-y"]
+    if enc_start:
+        cmd += ["-ss", f"{enc_start * FRAME_SAMPLES / sample_rate:.6f}"]
+    cmd += ["-i", str(mp4_file)]
+    if end_frame is not None:
+        length = end_frame + POSTROLL_FRAMES - enc_start
+        cmd += ["-t", f"{length * FRAME_SAMPLES / sample_rate:.6f}"]
+    cmd += [
+        "-vn", "-map", "0:a:0", "-ar", str(sample_rate),
+        "-c:a", "libmp3lame", "-b:a", bitrate, "-reservoir", "0",
+        "-id3v2_version", "0", "-write_xing", "1",
+        str(out_file), "-loglevel", "error",
+    ]
+    return cmd, enc_start
+
+def encode_segmented(mp4_file, out_file, duration, sample_rate, bitrate, segments, workers,
+                     on_progress=None, timeout=None, token=None, slots=None):
+    """
+    分段并行编码并拼接为 out_file
+    - segments: 期望的分段数；workers: 并行编码进程数上限（含调用线程自己）
+    - on_progress: 回调 on_progress(已处理媒体秒数，各段之和)
+    - timeout: 单段编码的超时秒数
+    - token: 所属任务的 CancelToken（见 ffmpeg_runner）
+    - slots: 额外并发名额，需提供 try_acquire() / release()；每个额外的并行分段先申请一个名额，
+      申请不到时由调用线程顺序编码。为 None 时不限制（只受 workers 约束）
+    :return: 实际分段数
+    :raise SegmentError: 任一段失败或拼接失败
+    """
+    sample_rate = choose_sample_rate(sample_rate)
+    plan = plan_segments(duration, sample_rate, segments)
+    work_dir = out_file.parent / f".{out_file.name}.segments"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    done_seconds = [0.0] * len(plan)
+
+    def encode(index):
+        start_frame, end_frame = plan[index]
+        seg_file = work_dir / f"seg_{index:04d}.mp3"
+        cmd, enc_start = build_segment_cmd(mp4_file, seg_file, start_frame, end_frame, sample_rate, bitrate)
+
+        def progress(seconds):
+            done_seconds[index] = seconds
+            if on_progress:
+                on_progress(sum(done_seconds))
+
+        returncode, stderr, _ = run_ffmpeg(cmd, progress, timeout, token)
+        if returncode != 0:
+            raise SegmentError(f"第 {index + 1} 段编码失败: {stderr}")
+        return seg_file, enc_start
+
+    encoded = [None] * len(plan)
+    remaining = list(reversed(range(len(plan))))
+    errors = []
+    helpers = []
+    lock = threading.Lock()
+
+    def take():
+        with lock:
+            return remaining.pop() if remaining and not errors else None
+
+    def run(index):
+        try:
+            encoded[index] = encode(index)
+            return True
+        except BaseException as e:
+            with lock:
+                errors.append(e)
+            return False
+
+    def helper():
+        try:
+            while (index := take()) is not None and run(index):
+                pass
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def spawn_helpers():
+        # 每次开始新的一段前，按空闲名额补充并行的辅助线程
+        while remaining and len(helpers) < max(1, workers) - 1 and (slots is None or slots.try_acquire()):
+            thread = threading.Thread(target=helper, name="segment-encoder", daemon=True)
+            helpers.append(thread)
+            thread.start()
+
+    try:
+        try:
+            while (index := take()) is not None:
+                spawn_helpers()
+                if not run(index):
+                    break
+        finally:
+            for thread in helpers:
+                thread.join()
+        if errors:
+            raise errors[0]
+        _join(encoded, plan, out_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return len(plan)
+
+def _join(encoded, plan, out_file):
+    """
+    按全局帧号截取各段的有效帧并依次写入（内存中同时只保留一段），
+    最后回到文件开头写入修正后的 Info 帧（长度不变，原位覆盖）
+    """
+    head_info = None
+    end_padding = None
+    frame_count = 0
+    audio_bytes = 0
+    with open(out_file, "wb") as f:
+        for index, ((seg_file, enc_start), (start_frame, end_frame)) in enumerate(zip(encoded, plan)):
+            info, frames = split_frames(Path(seg_file).read_bytes())
+            if index == 0:
+                head_info = info
+                if head_info is not None:
+                    f.write(head_info)          # 占位，结束后改写
+            keep_from = start_frame - enc_start
+            keep_to = None if end_frame is None else end_frame - enc_start
+            if end_frame is None:
+                padding = read_padding(info) if info else None
+                end_padding = padding[1] if padding else None
+            elif len(frames) < keep_to:
+                raise SegmentError(f"第 {index + 1} 段帧数不足（{len(frames)} < {keep_to}）")
+            for frame in frames[keep_from:keep_to]:
+                f.write(frame)
+                frame_count += 1
+                audio_bytes += len(frame)
+
+        if frame_count == 0:
+            raise SegmentError("拼接结果为空")
+        if head_info is not None:
+            f.seek(0)
+            f.write(rewrite_info_frame(head_info, frame_count, audio_bytes + len(head_info), end_padding))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 多节点分片与租约协调模块。
+超大回填任务需要多台机器（或同一台机器上的多个进程）同时处理同一个共享的 src_dir / dest_dir。
+原先两个进程会重复转换同一批文件，并通过 -y 互相覆盖输出。本模块提供两种互不冲突的分工方式：
+1、哈希分片（--shard I/N）：按源文件相对路径的哈希取模，第 I 个节点只处理属于自己的文件；无需任何协调，
+   但某个节点崩溃后，它负责的文件要重新运行该分片才能补齐。
+2、租约认领（--lease）：每个节点都扫描全部文件，转换前在输出目录的 .mp4_to_mp3_leases/ 下以 O_EXCL 创建租约文件认领该文件；
+   后台线程定期刷新自己持有的租约（修改时间），超过 --lease-ttl 未刷新的租约视为持有者已崩溃，其他节点可以接管。
+   完成后租约改写为 done / failed 标记（附带源文件大小、修改时间、编码参数与轮次标识），同一轮的其他节点据此跳过；
+   每个节点只提前认领少量即将执行的文件，各节点按自己的实际处理速度分担工作；
+   被其他节点持有的文件会在本节点空闲时定期复查，直到对方完成或租约过期，因此各节点会一起结束。
+3、轮次：节点启动时在租约目录下登记自己（nodes/<节点标识>.json，随租约一起刷新）；已有存活节点时加入它们的轮次（run.json），
+   否则开启新的一轮。只有同一轮写入的 done / failed 标记才会被采纳，更早的运行一律交给清单判断（清单会校验输出是否仍然存在），
+   因此删除输出后重跑会重新生成，上次失败的文件也会重新尝试。
+4、节点标识默认为主机名，重启后保持不变（--resume 能找到上次的任务表）；同一标识已被另一个存活进程使用时拒绝启动，
+   同一台机器上运行多个进程时须用 --worker-id 区分；
+   以同一标识重启时，崩溃前留下的租约可立即接管，无需等待过期。没有存活登记的节点视为已退出，其清单与探测索引会被并入当前节点后删除。
+两种方式下，各节点的清单、任务表与探测索引都写入带节点标识的独立文件，避免并发覆盖；增量判断时会同时读取其他节点的清单（同一文件以最近的记录为准）。
+租约过期依赖各节点时钟大致同步（相差应远小于 --lease-ttl）。
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import contextlib
+import socket
+import hashlib
+import threading
+from pathlib import Path
+
+LEASE_DIR_NAME = ".mp4_to_mp3_leases"
+RUN_FILE_NAME = "run.json"
+NODES_DIR_NAME = "nodes"
+
+# claim() 的结果
+CLAIMED = "claimed"                # 本节点已认领，可以开始转换
+DONE = "done"                      # 其他节点已完成（或已确认失败），本次跳过
+BUSY = "busy"                      # 其他节点正在处理，稍后复查
+
+_RUNNING = "running"
+_FAILED = "failed"
+_STALE = "stale"
+
+def path_hash(rel_path):
+    return hashlib.sha1(Path(rel_path).as_posix().encode("utf-8")).hexdigest()
+
+def in_shard(rel_path, shard):
+    """
+    判断文件是否属于给定分片
+    - shard: (index, count)，index 从 0 开始
+    """
+    index, count = shard
+    return int(path_hash(rel_path)[:8], 16) % count == index
+
+def parse_shard(value):
+    """解析 "I/N"（I 从 0 开始），如 "0/4"；格式错误时抛出 ValueError"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)
+    if not match:
+        raise ValueError(f"分片格式应为 I/N（如 0/4）: {value}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or index >= count:
+        raise ValueError(f"分片序号应满足 0 <= I < N: {value}")
+    return index, count
+
+class LeaseError(Exception):
+    """无法加入租约协调（如节点标识已被另一个存活进程使用）"""
+
+def default_worker_id():
+    """主机名（重启后保持不变；同一台机器上运行多个节点进程时须显式指定各自的 --worker-id）"""
+    return sanitize_tag(socket.gethostname())
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OverflowError, TypeError, ValueError):
+        pass
+    return True
+
+def state_tag(shard=None, lease=False, worker_id=None):
+    """
+    多节点运行时区分本节点状态文件（清单、任务表、探测索引、日志）的标识；单节点运行返回 None
+    - shard: (index, count) 或 None
+    """
+    if not (shard or lease):
+        return None
+    if worker_id:
+        return sanitize_tag(worker_id)
+    if lease:
+        return default_worker_id()
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+def sanitize_tag(value):
+    """节点标识会用作文件名的一部分，只保留字母、数字、点、下划线与连字符"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value).strip(".") or "worker"
+
+class LeaseManager:
+    """
+    基于共享文件系统的租约协调（claim / complete 只在主线程中调用，刷新由后台线程完成）
+    用法:
+        leases = LeaseManager(dest_path, worker_id, ttl=120, settings=settings).start()
+        if leases.claim(rel_path, src_stat) == CLAIMED: ...转换...
+        leases.complete(rel_path, src_stat, ok)
+        leases.close()             # 释放仍持有的租约
+    """
+
+    def __init__(self, dest_path, worker_id, ttl=120.0, settings=None):
+        self.dir = Path(dest_path) / LEASE_DIR_NAME
+        self.worker_id = sanitize_tag(worker_id)
+        self.ttl = ttl
+        self.settings_key = hashlib.sha1(
+            json.dumps(settings or {}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.run_id = None         # 本轮标识，start() 时加入存活节点的轮次或开启新的一轮
+        self.node_path = self.dir / NODES_DIR_NAME / f"{self.worker_id}.json"
+        self._held = {}            # 租约文件路径 -> rel_path
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+
+    def start(self):
+        """
+        登记本节点并确定本轮标识，随后开始后台刷新
+        :raise LeaseError: 节点标识已被另一个存活进程使用
+        """
+        self.node_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._run_lock():
+            record = self._read_json(self.node_path)
+            if record is not None and self._node_alive(self.node_path, record):
+                raise LeaseError(f"节点标识 {self.worker_id} 正被另一个进程使用（{record.get('host')} 进程 {record.get('pid')}），"
+                                 f"同一台机器上运行多个节点时请用 --worker-id 指定不同的标识")
+            if any(self.is_live(path.stem) for path in self.node_path.parent.glob("*.json")
+                   if path != self.node_path):
+                self.run_id = (self._read_json(self.dir / RUN_FILE_NAME) or {}).get("run")
+            if not self.run_id:
+                self.run_id = uuid.uuid4().hex
+                self._write_json(self.dir / RUN_FILE_NAME, {"run": self.run_id, "time": time.time()})
+            self._write_json(self.node_path, {"host": socket.gethostname(), "pid": os.getpid(),
+                                              "run": self.run_id, "time": time.time()})
+        self._thread.start()
+        return self
+
+    @contextlib.contextmanager
+    def _run_lock(self):
+        """登记节点与确定轮次须串行进行：以 O_EXCL 创建锁文件，持有者崩溃时锁在 ttl 后视为过期"""
+        lock_path = self.dir / "run.lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime >= self.ttl:
+                        lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, data):
+        tmp = path.with_name(f"{path.name}.{self.worker_id}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _node_alive(self, path, record):
+        """登记在 ttl 内刷新过视为存活；同一台机器上的登记还要求进程仍然存在（崩溃后可立即以同一标识重启）"""
+        try:
+            if time.time() - path.stat().st_mtime >= self.ttl:
+                return False
+        except OSError:
+            return False
+        if record.get("host") == socket.gethostname():
+            return _pid_alive(record.get("pid"))
+        return True
+
+    def is_live(self, worker_id):
+        """该节点标识是否仍有存活的进程（本节点始终视为存活）"""
+        if sanitize_tag(worker_id) == self.worker_id:
+            return True
+        path = self.node_path.parent / f"{sanitize_tag(worker_id)}.json"
+        record = self._read_json(path)
+        return record is not None and self._node_alive(path, record)
+
+    @property
+    def held(self):
+        """本节点当前持有（已认领、尚未完成）的租约数"""
+        with self._lock:
+            return len(self._held)
+
+    def active(self, rel_path):
+        """
+        该文件是否正由存活的其他节点处理（租约为 running、未过期且持有者仍在运行），此时不能删除其临时输出；
+        本节点标识下、本进程又未持有的租约来自崩溃前的本节点，视为不活跃
+        """
+        path = self._path(rel_path)
+        record = self._read_json(path)
+        if not record or record.get("state") != _RUNNING:
+            return False
+        worker = record.get("worker") or ""
+        if worker == self.worker_id:
+            with self._lock:
+                return path in self._held
+        try:
+            fresh = time.time() - path.stat().st_mtime < self.ttl
+        except OSError:
+            return False
+        return fresh and self.is_live(worker)
+
+    def _path(self, rel_path):
+        digest = path_hash(rel_path)
+        return self.dir / digest[:2] / f"{digest}.lease"
+
+    def _record(self, state, rel_path, src_stat):
+        return {
+            "worker": self.worker_id,
+            "state": state,
+            "path": Path(rel_path).as_posix(),
+            "size": src_stat.st_size,
+            "mtime_ns": src_stat.st_mtime_ns,
+            "settings": self.settings_key,
+            "run": self.run_id,
+            "time": time.time(),
+        }
+
+    def _inspect(self, path, src_stat):
+        """判断已存在的租约文件：DONE / BUSY / _STALE（可以接管）"""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return _STALE
+        except OSError:
+            return BUSY
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return _STALE
+        except (OSError, ValueError):
+            # 其他节点可能刚创建、尚未写完；长时间保持损坏则视为过期
+            return BUSY if time.time() - st.st_mtime < self.ttl else _STALE
+        state = record.get("state")
+        if state == _RUNNING:
+            # 同一节点标识不会有两个存活进程（见 start），标识相同、本进程又未持有的租约来自崩溃前的本节点，可立即接管
+            if record.get("worker") == self.worker_id:
+                with self._lock:
+                    if path not in self._held:
+                        return _STALE
+            return BUSY if time.time() - st.st_mtime < self.ttl else _STALE
+        same_source = (record.get("size") == src_stat.st_size and record.get("mtime_ns") == src_stat.st_mtime_ns
+                       and record.get("settings") == self.settings_key)
+        # 只认本轮写入的标记（本轮已有节点完成，或已转换失败、不在其他节点上重复尝试）；
+        # 更早的运行由清单判断是否需要重新转换（清单会校验输出是否仍然存在），上次失败的文件会重新尝试
+        if same_source and state in (DONE, _FAILED) and record.get("run") == self.run_id:
+            return DONE
+        return _STALE
+
+    def _break(self, path, src_stat):
+        """
+        接管过期租约：先把它重命名为本节点专属的临时名（同一时刻只有一个节点能成功），
+        再确认拿到的确实是过期租约；若恰好拿到了别人刚创建的新租约，则尽量放回并放弃
+        """
+        stale = path.with_name(f"{path.name}.{self.worker_id}.stale")
+        try:
+            os.replace(path, stale)
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+        try:
+            if self._inspect(stale, src_stat) != _STALE:
+                try:
+                    os.link(stale, path)
+                except OSError:
+                    pass
+                return False
+            return True
+        finally:
+            stale.unlink(missing_ok=True)
+
+    def claim(self, rel_path, src_stat):
+        """:return: CLAIMED / DONE / BUSY"""
+        path = self._path(rel_path)
+        path.parent.mkdir(exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                state = self._inspect(path, src_stat)
+                if state != _STALE:
+                    return state
+                if not self._break(path, src_stat):
+                    return BUSY
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._record(_RUNNING, rel_path, src_stat), f)
+            with self._lock:
+                self._held[path] = rel_path
+            return CLAIMED
+        return BUSY
+
+    def complete(self, rel_path, src_stat, ok):
+        """把本节点持有的租约改写为 done / failed 标记（原子替换）"""
+        path = self._path(rel_path)
+        with self._lock:
+            if self._held.pop(path, None) is None:
+                return
+        tmp = path.with_name(f"{path.name}.{self.worker_id}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._record(DONE if ok else _FAILED, rel_path, src_stat), f)
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 3):
+            with self._lock:
+                paths = [self.node_path, *self._held]
+            for path in paths:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        """停止刷新并释放全部未完成的租约（中断或取消时，让其他节点无需等待过期即可接管）"""
+        self._stop.set()
+        with self._lock:
+            paths, self._held = list(self._held), {}
+        for path in [*paths, self.node_path]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 按节点分别保存的 JSON 状态文件（转换清单、探测索引的公共部分）。
+清单与探测索引都以源文件相对路径为键保存在输出目录下，多节点运行时需要同样的读写规则，集中在本模块中实现：
+1、文件命名：单机运行写入 <名称>.json，多节点运行时每个节点写入 <名称>.<节点标识>.json，避免并发覆盖。
+2、共享读取：同目录下其他节点的文件作为只读记录一并加载；同一文件有多条记录时按写入时间取最近的一条（与文件名顺序无关）。
+3、退出节点：retire(节点标识) 为 True 的节点已经退出，其记录并入当前节点，下次保存成功后删除其文件，状态文件数量不随运行次数增长。
+4、落盘：定期自动保存，写入时先写临时文件再原子替换，写到一半时不会损坏。
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+
+class TaggedState:
+    """
+    按节点分别保存的 JSON 状态（只在主线程中调用），子类指定 NAME 与 VERSION
+    用法:
+        state = SubClass.load(dest_path, tag="node1", retire=lambda tag: ...)
+        entry = state.lookup(rel_path)
+        state.store(rel_path, {...})
+        state.save()
+    """
+
+    NAME = None                   # 单机运行时的文件名，如 ".mp4_to_mp3_manifest.json"
+    VERSION = None                # 文件格式版本，不符时视为空
+
+    def __init__(self, path, entries=None, autosave_interval=30.0, shared=None):
+        self.path = Path(path)
+        self.entries = entries or {}
+        self.shared = shared or {}    # 其他节点的记录（只读）
+        self.autosave_interval = autosave_interval
+        self._retired = []            # 已并入本节点、待下次保存后删除的其他节点文件
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    @classmethod
+    def _read(cls, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == cls.VERSION:
+                return data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    @classmethod
+    def load(cls, dest_path, tag=None, retire=None):
+        """
+        从输出目录加载，文件不存在、损坏或版本不符时返回空状态
+        - tag: 多节点运行时的节点标识，写入 <名称>.<tag>.json
+        - retire: 可选的判断函数 retire(其他节点标识)，为 True 的节点已经退出，其记录并入本节点并在下次保存后删除其文件
+        """
+        dest_path = Path(dest_path)
+        prefix = cls.NAME[:-len(".json")]
+        path = dest_path / (f"{prefix}.{tag}.json" if tag else cls.NAME)
+        entries, shared, retired = cls._read(path), {}, []
+        for other in dest_path.glob(f"{prefix}*.json"):
+            if other == path:
+                continue
+            other_tag = other.name[len(prefix) + 1:-len(".json")] if other.name != cls.NAME else None
+            if other_tag and retire is not None and retire(other_tag):
+                cls._merge(entries, cls._read(other))
+                retired.append(other)
+            else:
+                cls._merge(shared, cls._read(other))
+        state = cls(path, entries, shared=shared)
+        state._retired = retired
+        state._dirty = bool(retired)
+        return state
+
+    @staticmethod
+    def key(rel_path):
+        """统一使用 posix 风格的相对路径作为键，保证跨平台一致"""
+        return Path(rel_path).as_posix()
+
+    @staticmethod
+    def _newer(entry, other):
+        """同一文件的两条记录取较新的一条（早期版本的记录没有 time 字段，视为最旧）"""
+        if not entry or (other and other.get("time", 0) > entry.get("time", 0)):
+            return other
+        return entry
+
+    @classmethod
+    def _merge(cls, entries, others):
+        for key, entry in others.items():
+            entries[key] = cls._newer(entries.get(key), entry)
+
+    def lookup(self, rel_path):
+        """本节点与其他节点的记录中较新的一条，没有记录时返回 None"""
+        key = self.key(rel_path)
+        return self._newer(self.entries.get(key), self.shared.get(key))
+
+    def store(self, rel_path, entry):
+        """写入本节点的记录（附带写入时间），并定期落盘，进程意外退出时也能保留大部分进度"""
+        self.entries[self.key(rel_path)] = dict(entry, time=time.time())
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.autosave_interval:
+            self.save()
+
+    def save(self):
+        """原子写入：先写临时文件再替换；成功后删除已并入本节点的其他节点文件"""
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        for retired in self._retired:
+            retired.unlink(missing_ok=True)
+        self._retired = []
+        self._dirty = False
+        self._last_save = time.monotonic()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, -*-
+
+"""
+Skill Name: MP4-To-MP3-Extractor
+Author: 王岷瑞/https://github.com/wangminrui2022
+License: Apache License
+Description: 热文件夹（hot folder）监听模块。
+原先只能由 cron 反复启动 extract.py，每次都要重新走一遍虚拟环境检查和整棵目录树扫描，新文件最长要等到下一个 cron 周期才会被处理。
+--watch 模式下进程常驻，解释器与依赖只加载一次：
+1、变化检测：Linux 下通过 inotify（ctypes 直接调用 libc，无需第三方依赖）递归监听目录，新建的子目录会自动加入监听；
+   inotify 不可用（非 Linux、监听数超出上限）或显式指定 --watch-poll 时回退为定时扫描。
+   注意：NFS/SMB 等网络共享上由其他机器写入的文件不会产生 inotify 事件，这种情况请使用 --watch-poll。
+2、防抖：文件大小与修改时间在 settle 秒内保持不变才视为写入完成，避免转换上传到一半的文件。
+3、与转换阶段衔接：与 DiscoveryWorker 接口一致，就绪的文件直接进入原有的调度与转换流程；启动时已有的文件照常由转换清单判断是否跳过。
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from discovery import DiscoveryWorker, iter_files
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyUnavailable(Exception):
+    """当前平台或系统限制下无法使用 inotify"""
+
+class _Inotify:
+    """基于 ctypes 的最小 inotify 封装（只监听目录）"""
+
+    def __init__(self):
+        if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+            raise InotifyUnavailable("仅 Linux 支持 inotify")
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+            self.fd = libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailable(str(e))
+        if self.fd < 0:
+            raise InotifyUnavailable(os.strerror(ctypes.get_errno()))
+        self.dirs = {}                 # wd -> 目录路径
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise InotifyUnavailable("监听数量超出 fs.inotify.max_user_watches 上限")
+            return None                # 目录已消失或无权限，忽略
+        self.dirs[wd] = path
+        return wd
+
+    def read_events(self, timeout):
+        """等待至多 timeout 秒，返回 [(目录路径, 文件名, mask), ...]"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            events.append((self.dirs.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class WatchWorker(DiscoveryWorker):
+    """
+    常驻监听线程：先扫描已有文件，再持续把写入完成的新文件/变化文件放入队列
+    接口与 DiscoveryWorker 相同，但 done 在 stop() 之前始终为 False。
+    用法:
+        worker = WatchWorker(src_path, settle=5.0).start()
+        for item in worker.drain(block=True, timeout=0.5): ...
+    """
+
+    def __init__(self, root, suffix=".mp4", settle=5.0, force_poll=False, maxsize=1024,
+                 on_error=None, on_notice=None):
+        super().__init__(root, suffix, maxsize, on_error)
+        self.settle = max(0.0, settle)
+        self.force_poll = force_poll
+        self.on_notice = on_notice     # 回调 on_notice(消息)，用于记录监听方式等提示
+        self.method = None             # "inotify" 或 "poll"
+        self._suffix = os.path.normcase(suffix)
+        self._candidates = {}          # 路径 -> (size, mtime_ns, 最近一次变化的时间)
+        self._emitted = {}             # 路径 -> (size, mtime_ns)，已交给转换阶段的版本
+        self._thread.name = "mp4-watch"
+
+    def _notice(self, message):
+        if self.on_notice:
+            self.on_notice(message)
+
+    def _observe(self, path, st, initial=False):
+        """记录一次观察到的文件状态；启动时已存在且近期未被修改的文件直接就绪"""
+        version = (st.st_size, st.st_mtime_ns)
+        if self._emitted.get(path) == version:
+            return
+        if initial and time.time() - st.st_mtime >= self.settle:
+            self._emit(path, st)
+            return
+        previous = self._candidates.get(path)
+        if previous is None or previous[:2] != version:
+            self._candidates[path] = version + (time.monotonic(),)
+
+    def _emit(self, path, st):
+        if self._put((Path(path), st)):
+            self._emitted[path] = (st.st_size, st.st_mtime_ns)
+
+    def _check_candidates(self):
+        """大小与修改时间在 settle 秒内未变化的候选文件视为写入完成"""
+        now = time.monotonic()
+        for path, (size, mtime_ns, since) in list(self._candidates.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._candidates[path]          # 上传中途被删除或改名
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._candidates[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - since >= self.settle:
+                del self._candidates[path]
+                self._emit(path, st)
+
+    def _scan(self, root, initial=False):
+        for path, st in iter_files(root, self.suffix, self.on_error):
+            if self._stop.is_set():
+                return
+            self._observe(str(path), st, initial)
+
+    def _watch_tree(self, inotify, root):
+        """递归为 root 及其子目录添加监听"""
+        stack = [str(root)]
+        while stack:
+            current = stack.pop()
+            if inotify.add_watch(current) is None:
+                continue
+            try:
+                with os.scandir(current) as it:
+                    stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError as e:
+                if self.on_error:
+                    self.on_error(current, e)
+
+    def _handle_event(self, inotify, directory, name, mask):
+        if directory is None:
+            return
+        path = os.path.join(directory, name) if name else directory
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # 新目录（或整个目录被移入）：加入监听并扫描其中已有的文件
+                self._watch_tree(inotify, path)
+                self._scan(path)
+            return
+        if not os.path.normcase(name).endswith(self._suffix):
+            return
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self._candidates.pop(path, None)
+            self._emitted.pop(path, None)
+            return
+        try:
+            self._observe(path, os.stat(path))
+        except OSError:
+            pass
+
+    def _tick(self):
+        return max(0.2, min(1.0, self.settle / 2)) if self.settle else 0.2
+
+    def _run_inotify(self, inotify):
+        while not self._stop.is_set():
+            for directory, name, mask in inotify.read_events(self._tick()):
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出会丢事件，补一次全量扫描
+                    self._notice("inotify 事件队列溢出，重新扫描源目录")
+                    self._scan(self.root)
+                    continue
+                self._handle_event(inotify, directory, name, mask)
+            self._check_candidates()
+
+    def _run_poll(self):
+        interval = max(self.settle, 1.0)
+        next_scan = time.monotonic() + interval
+        while not self._stop.is_set():
+            if time.monotonic() >= next_scan:
+                self._scan(self.root)
+                next_scan = time.monotonic() + interval
+            self._check_candidates()
+            self._stop.wait(self._tick())
+
+    def _run(self):
+        inotify = None
+        try:
+            if not self.force_poll:
+                try:
+                    inotify = _Inotify()
+                    # 先建立监听再扫描，扫描期间写入的文件也不会漏掉
+                    self._watch_tree(inotify, self.root)
+                except InotifyUnavailable as e:
+                    self._notice(f"inotify 不可用（{e}），改用定时扫描")
+                    if inotify is not None:
+                        inotify.close()
+                    inotify = None
+            self.method = "inotify" if inotify else "poll"
+            self._scan(self.root, initial=True)
+            if inotify:
+                self._run_inotify(inotify)
+            else:
+                self._run_poll()
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self._put(self._SENTINEL)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8, -*-
+"""测试直接导入 scripts/ 下的模块（与 python scripts/extract.py 运行时的导入方式一致）"""
+
+import os
+import sys
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+os.environ.setdefault("RUNNING_IN_VENV", "true")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8, -*-
+"""任务表的崩溃恢复：上次被强制结束的任务留下的临时输出在下次启动时被清理"""
+
+from pathlib import Path
+
+from extract import Extractor, _partial_path
+from job_queue import JobQueue, PENDING
+
+
+class _Stat:
+    st_size = 100
+    st_mtime_ns = 1
+
+
+def _seed_running(dest, rel_path, outputs):
+    """模拟被 SIGKILL 的运行：任务停在 running，计划输出的临时文件已写了一半"""
+    queue = JobQueue.open(dest)
+    queue.add(rel_path, _Stat())
+    queue.mark_running(rel_path, outputs)
+    queue.close()
+    partials = [_partial_path(dest / output) for output in outputs]
+    for partial in partials:
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        partial.write_bytes(b"half")
+    return partials
+
+
+def test_open_returns_interrupted_before_clearing(tmp_path):
+    _seed_running(tmp_path, Path("a/long.mp4"), ["a/long.mp3"])
+    queue = JobQueue.open(tmp_path, resume=False)
+    try:
+        assert queue.interrupted == [(Path("a/long.mp4"), ["a/long.mp3"])]
+        assert queue.counts() == {}
+    finally:
+        queue.close()
+
+
+def test_resume_requeues_interrupted(tmp_path):
+    _seed_running(tmp_path, Path("long.mp4"), ["long.mp3"])
+    queue = JobQueue.open(tmp_path, resume=True)
+    try:
+        assert [rel for rel, _ in queue.interrupted] == [Path("long.mp4")]
+        assert queue.counts() == {PENDING: 1}
+    finally:
+        queue.close()
+
+
+def test_non_resume_run_removes_partials(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "dest"
+    src.mkdir()
+    # 源文件已被删除，且记录的输出来自另一组参数（多规格子目录、.m4a 后缀），当前运行无法再推算出这些文件名
+    partials = _seed_running(dest, Path("gone/long.mp4"), ["gone/long.mp3", "opus_96k/gone/long.opus",
+                                                            "gone/long.m4a"])
+    segments = partials[0].with_name(f".{partials[0].name}.segments")
+    segments.mkdir()
+    assert all(p.exists() for p in partials)
+
+    Extractor(src, dest, progress_bar=False).run()
+
+    assert not any(p.exists() for p in partials)
+    assert not segments.exists()
+
+
+def test_retire_returns_running_rows_of_exited_nodes(tmp_path):
+    for tag in ("dead", "live"):
+        queue = JobQueue.open(tmp_path, tag=tag)
+        queue.add(Path("x.mp4"), _Stat())
+        queue.mark_running(Path("x.mp4"), ["x.mp3"])
+        queue.close()
+    retired = JobQueue.retire(tmp_path, lambda tag: tag == "dead")
+    assert retired == {"dead": [(Path("x.mp4"), ["x.mp3"])]}
+    assert not (tmp_path / ".mp4_to_mp3_jobs.dead.sqlite3").exists()
+    assert (tmp_path / ".mp4_to_mp3_jobs.live.sqlite3").exists()
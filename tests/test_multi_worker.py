@@ -0,0 +1,51 @@
+# -*- coding: utf-8, -*-
+"""多节点租约认领：多个 extract.py 进程处理同一个源目录与输出目录，每个文件只转换一次"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+from collections import Counter
+
+import pytest
+
+from conftest import SCRIPTS_DIR
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要 ffmpeg")
+
+WORKERS = 3
+FILES = 12
+
+
+def _make_clips(src):
+    for i in range(FILES):
+        clip = src / f"d{i % 3}" / f"clip{i}.mp4"
+        clip.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency={200 + i * 50}:duration=1",
+                        "-c:a", "aac", str(clip)], check=True)
+
+
+def test_lease_workers_convert_each_file_once(tmp_path):
+    src, dest = tmp_path / "src", tmp_path / "dest"
+    _make_clips(src)
+    env = dict(os.environ, RUNNING_IN_VENV="true")
+    procs = [subprocess.Popen([sys.executable, str(SCRIPTS_DIR / "extract.py"), str(src), str(dest),
+                               "--lease", "--worker-id", f"w{n}", "-j", "1",
+                               "--metrics-file", str(tmp_path / f"metrics.w{n}.jsonl")],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for n in range(WORKERS)]
+    assert [proc.wait(timeout=300) for proc in procs] == [0] * WORKERS
+
+    converted = Counter()
+    for n in range(WORKERS):
+        path = tmp_path / f"metrics.w{n}.jsonl"
+        if path.exists():
+            for line in path.read_text(encoding="utf-8").splitlines():
+                record = json.loads(line)
+                if record.get("status") == "success":
+                    converted[record["path"]] += 1
+    assert len(converted) == FILES and set(converted.values()) == {1}
+    outputs = sorted(p.relative_to(dest).as_posix() for p in dest.rglob("*") if p.suffix in (".mp3", ".m4a"))
+    assert len(outputs) == FILES
+    assert not list(dest.rglob(".*.partial*"))
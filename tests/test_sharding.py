@@ -0,0 +1,130 @@
+# -*- coding: utf-8, -*-
+"""哈希分片与租约认领"""
+
+import os
+import time
+
+import pytest
+
+from sharding import (BUSY, CLAIMED, DONE, LeaseError, LeaseManager, in_shard, parse_shard,
+                      state_tag)
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard(" 3 / 4 ") == (3, 4)
+
+
+@pytest.mark.parametrize("value", ["4/4", "1/0", "-1/4", "a/b", "1", "1/2/3", ""])
+def test_parse_shard_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_shards_partition_all_paths():
+    paths = [f"dir{i % 7}/clip{i}.mp4" for i in range(500)]
+    count = 4
+    owners = [[index for index in range(count) if in_shard(path, (index, count))] for path in paths]
+    assert all(len(owner) == 1 for owner in owners)          # 每个文件恰好属于一个分片
+    assert {owner[0] for owner in owners} == set(range(count))  # 每个分片都分到文件
+
+
+def test_state_tag():
+    assert state_tag() is None
+    assert state_tag(shard=(1, 4)) == "shard-1-of-4"
+    assert state_tag(lease=True, worker_id="node 1/a") == "node_1_a"
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"x")
+    return os.stat(path)
+
+
+def _lease(dest, worker, ttl=60.0):
+    return LeaseManager(dest, worker, ttl=ttl).start()
+
+
+def _crash(leases):
+    """模拟节点崩溃：停止刷新，但不释放租约与登记"""
+    leases._stop.set()
+    leases._thread.join()
+
+
+def test_claim_busy_then_done_in_same_run(tmp_path, src):
+    a = _lease(tmp_path, "a")
+    b = _lease(tmp_path, "b")
+    try:
+        assert b.run_id == a.run_id                       # 后启动的节点加入存活节点的轮次
+        assert a.claim("clip.mp4", src) == CLAIMED
+        assert b.claim("clip.mp4", src) == BUSY
+        assert b.active("clip.mp4")
+        a.complete("clip.mp4", src, ok=True)
+        assert b.claim("clip.mp4", src) == DONE
+    finally:
+        a.close()
+        b.close()
+
+
+def test_failed_marker_is_final_only_within_the_run(tmp_path, src):
+    a = _lease(tmp_path, "a")
+    assert a.claim("clip.mp4", src) == CLAIMED
+    a.complete("clip.mp4", src, ok=False)
+    b = _lease(tmp_path, "b")
+    assert b.claim("clip.mp4", src) == DONE               # 本轮已失败，不在其他节点上重复尝试
+    a.close()
+    b.close()
+    c = _lease(tmp_path, "c")                              # 没有存活节点：新的一轮，上次的标记不再采纳
+    try:
+        assert c.run_id != a.run_id
+        assert c.claim("clip.mp4", src) == CLAIMED
+    finally:
+        c.close()
+
+
+def test_heartbeat_keeps_lease_alive(tmp_path, src):
+    a = _lease(tmp_path, "a", ttl=0.6)
+    b = _lease(tmp_path, "b", ttl=0.6)
+    try:
+        assert a.claim("clip.mp4", src) == CLAIMED
+        time.sleep(1.2)                                    # 超过 ttl，但持有者一直在刷新
+        assert b.claim("clip.mp4", src) == BUSY
+    finally:
+        a.close()
+        b.close()
+
+
+def test_expired_lease_is_taken_over(tmp_path, src):
+    a = _lease(tmp_path, "a", ttl=0.6)
+    b = _lease(tmp_path, "b", ttl=0.6)
+    try:
+        assert a.claim("clip.mp4", src) == CLAIMED
+        _crash(a)
+        time.sleep(0.8)
+        assert not b.active("clip.mp4")
+        assert b.claim("clip.mp4", src) == CLAIMED
+    finally:
+        b.close()
+
+
+def test_live_worker_id_is_rejected(tmp_path):
+    a = _lease(tmp_path, "same")
+    try:
+        with pytest.raises(LeaseError):
+            _lease(tmp_path, "same")
+    finally:
+        a.close()
+    _lease(tmp_path, "same").close()                       # 退出后可以再次使用同一标识
+
+
+def test_restart_with_same_id_takes_over_own_leases(tmp_path, src):
+    a = _lease(tmp_path, "node")
+    assert a.claim("clip.mp4", src) == CLAIMED
+    _crash(a)
+    a.node_path.unlink()                                   # 登记已失效（如进程已不存在）
+    restarted = _lease(tmp_path, "node")
+    try:
+        assert restarted.claim("clip.mp4", src) == CLAIMED  # 无需等待 ttl 过期
+    finally:
+        restarted.close()
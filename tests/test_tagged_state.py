@@ -0,0 +1,40 @@
+# -*- coding: utf-8, -*-
+"""按节点保存的状态文件：按写入时间合并、并入已退出节点"""
+
+import json
+
+from manifest import ConversionManifest, MANIFEST_VERSION
+from probe_index import ProbeIndex
+
+
+def _write(path, entries, version=MANIFEST_VERSION):
+    path.write_text(json.dumps({"version": version, "entries": entries}), encoding="utf-8")
+
+
+def test_shared_entries_merge_by_recency_not_filename(tmp_path):
+    # 文件名排序靠后的节点记录更旧，仍应以写入时间较新的记录为准
+    _write(tmp_path / ".mp4_to_mp3_manifest.a.json", {"x.mp4": {"size": 2, "time": 200}})
+    _write(tmp_path / ".mp4_to_mp3_manifest.z.json", {"x.mp4": {"size": 1, "time": 100}})
+    _write(tmp_path / ".mp4_to_mp3_manifest.json", {"x.mp4": {"size": 0}})   # 早期记录没有 time
+    manifest = ConversionManifest.load(tmp_path, tag="me")
+    assert manifest.lookup("x.mp4")["size"] == 2
+
+
+def test_own_entry_loses_to_newer_shared_entry(tmp_path):
+    _write(tmp_path / ".mp4_to_mp3_manifest.me.json", {"x.mp4": {"size": 1, "time": 100}})
+    _write(tmp_path / ".mp4_to_mp3_manifest.other.json", {"x.mp4": {"size": 2, "time": 200}})
+    assert ConversionManifest.load(tmp_path, tag="me").lookup("x.mp4")["size"] == 2
+
+
+def test_retired_nodes_are_merged_then_deleted_after_save(tmp_path):
+    dead = tmp_path / ".mp4_to_mp3_probe.dead.json"
+    live = tmp_path / ".mp4_to_mp3_probe.live.json"
+    _write(dead, {"a.mp4": {"size": 1, "time": 1}}, version=1)
+    _write(live, {"b.mp4": {"size": 1, "time": 1}}, version=1)
+    index = ProbeIndex.load(tmp_path, tag="me", retire=lambda tag: tag == "dead")
+    assert "a.mp4" in index.entries and "b.mp4" in index.shared
+    assert dead.exists()                  # 保存成功之前不删除，避免丢失记录
+    index.save()
+    assert not dead.exists() and live.exists()
+    reloaded = json.loads((tmp_path / ".mp4_to_mp3_probe.me.json").read_text(encoding="utf-8"))
+    assert "a.mp4" in reloaded["entries"]